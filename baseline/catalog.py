@@ -0,0 +1,87 @@
+"""
+Full-catalog ranking for methods that score every item.
+
+Instead of ranking the target among the split's sampled negatives, every
+unseen item of the catalog is a candidate. Scores are produced for blocks of
+users at a time, as dense user x item arrays of at most `block_mb`, so memory
+stays bounded however large the split and the catalog are. In every block the
+user's earlier interactions are masked out, the target's exact rank is counted
+and the top k items are picked with `argpartition` and only those k are sorted.
+
+Items are ordered by descending score, then by descending tiebreak when the
+method has one, then by ascending item code. Ranks follow that order exactly,
+the top k lists may break ties at the k-th place differently.
+"""
+
+import numpy as np
+import scipy.sparse as sp
+
+
+def seen_matrix(users, items, uids, num_items, lengths=None):
+    """
+    Binary CSR matrix with the interactions of `uids[r]` in row r, from interactions sorted by
+    (user, timestamp). A uid may appear in several rows (the windows of a windowed split), with
+    `lengths` row r holds only the first `lengths[r]` interactions of its user, the ones before
+    that window's target.
+    """
+    users = np.asarray(users)
+    uids = np.asarray(uids)
+    starts = np.searchsorted(users, uids, side='left')
+    counts = np.searchsorted(users, uids, side='right') - starts
+    if lengths is not None:
+        counts = np.minimum(counts, np.asarray(lengths))
+    # the interactions of row r are users[starts[r]:starts[r] + counts[r]]
+    indptr = np.concatenate([[0], np.cumsum(counts)])
+    offsets = np.arange(indptr[-1]) - np.repeat(indptr[:-1], counts)
+    indices = np.asarray(items)[np.repeat(starts, counts) + offsets]
+    matrix = sp.csr_matrix((np.ones(len(indices), dtype=np.float32), indices, indptr), shape=(len(uids), num_items))
+    matrix.sum_duplicates()
+    matrix.data[:] = 1
+    return matrix
+
+
+def block_rows(num_items, block_mb):
+    # float64 scores plus the tiebreak and comparison temporaries of one block
+    return max(1, int(block_mb * 2 ** 20 // (num_items * 8 * 4)))
+
+
+def catalog_ranks(score_block, seen, targets, num_items, k=10, block_mb=256):
+    """
+    `score_block(start, stop)` returns (scores, tiebreak) for users start:stop, both
+    (stop - start, num_items) arrays, tiebreak may be None. `seen` is a CSR user x item
+    matrix of items to leave out, the target is never left out.
+    Returns the 1-based rank of every target and the (num_users, k) top item codes.
+    """
+    targets = np.asarray(targets)
+    ranks = np.zeros(len(targets), dtype=np.int64)
+    top = np.zeros((len(targets), min(k, num_items)), dtype=np.int64)
+    step = block_rows(num_items, block_mb)
+    codes = np.arange(num_items)
+    for start in range(0, len(targets), step):
+        stop = min(start + step, len(targets))
+        scores, tiebreak = score_block(start, stop)
+        scores = np.array(scores, dtype=np.float64)
+        rows = np.arange(stop - start)
+        target = targets[start:stop]
+
+        # earlier interactions drop to the bottom
+        mask = seen[start:stop].tocoo()
+        keep = mask.col != target[mask.row]
+        scores[mask.row[keep], mask.col[keep]] = -np.inf
+
+        target_score = scores[rows, target][:, None]
+        before = codes < target[:, None]
+        if tiebreak is not None:
+            tiebreak = np.asarray(tiebreak, dtype=np.float64)
+            target_tiebreak = tiebreak[rows, target][:, None]
+            before = (tiebreak > target_tiebreak) | ((tiebreak == target_tiebreak) & before)
+        ranks[start:stop] = (np.count_nonzero(scores > target_score, axis=1)
+                             + np.count_nonzero((scores == target_score) & before, axis=1) + 1)
+
+        # top k by score, only the k picked items are sorted
+        part = np.argpartition(scores, num_items - top.shape[1], axis=1)[:, num_items - top.shape[1]:]
+        part_scores = np.take_along_axis(scores, part, axis=1)
+        keys = (part, -np.take_along_axis(tiebreak, part, axis=1)) if tiebreak is not None else (part,)
+        order = np.lexsort(keys + (-part_scores,), axis=-1)
+        top[start:stop] = np.take_along_axis(part, order, axis=1)
+    return ranks, top
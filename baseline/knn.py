@@ -0,0 +1,114 @@
+"""
+Item-kNN baseline on sequential co-occurrence.
+
+Two items co-occur when a user interacted with both within `window` steps of
+each other. The counts of all users are summed once into a scipy.sparse item x
+item matrix, optionally cosine normalized by item frequency, and pruned to the
+`top_n` strongest neighbours per item. A candidate's score is its summed
+similarity to the items in the user's history. Only the candidates are
+scored: every (history item, candidate) pair of a block of users is looked up
+in the sparse matrix in one vectorized call and summed per candidate, instead
+of multiplying out the scores of the whole catalog.
+
+The matrix is built in blocks of item rows, so the pairs of a large dataset
+are never all in memory at once.
+
+Every user's last interaction is the test target of the seq dataset, so it is
+left out of the counts.
+"""
+
+import itertools
+
+import numpy as np
+import scipy.sparse as sp
+
+
+def training_interactions(users, items, timestamps):
+    """Sorts interactions by (user, timestamp) and drops every user's last one. Returns (users, items)."""
+    order = np.lexsort((timestamps, users))
+    users, items = users[order], items[order]
+    keep = np.ones(len(users), dtype=bool)
+    keep[:-1] = users[1:] == users[:-1]
+    keep[-1:] = False
+    return users[keep], items[keep]
+
+
+def item_similarity(users, items, num_items, window=5, top_n=100, normalize=True, max_pairs=1 << 25):
+    """
+    Item x item CSR similarity from interactions sorted by (user, timestamp).
+    `top_n` neighbours are kept per item, None keeps all of them. Rows are built
+    in blocks of items with about `max_pairs` co-occurring pairs each, so memory
+    is bounded by one block and the pruned result instead of all pairs at once.
+    """
+    items = np.asarray(items, dtype=np.int32)
+    same = [users[lag:] == users[:-lag] for lag in range(1, window + 1)]
+    # pairs with each item as the first item, to cut the rows into blocks of similar size
+    degree = np.zeros(num_items)
+    for lag, mask in enumerate(same, 1):
+        degree += np.bincount(items[:-lag], weights=mask, minlength=num_items)
+        degree += np.bincount(items[lag:], weights=mask, minlength=num_items)
+    bounds = np.searchsorted(np.cumsum(degree), np.arange(1, int(degree.sum() // max_pairs) + 1) * max_pairs)
+    bounds = np.unique(np.concatenate([[0], bounds, [num_items]]))
+    scale = np.sqrt(np.bincount(items, minlength=num_items)).astype(np.float32) if normalize else None
+
+    blocks = []
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        inside = (items >= lo) & (items < hi)
+        rows, cols = [], []
+        for lag, mask in enumerate(same, 1):
+            forward = mask & inside[:-lag]
+            backward = mask & inside[lag:]
+            rows += [items[:-lag][forward], items[lag:][backward]]
+            cols += [items[lag:][forward], items[:-lag][backward]]
+        rows = np.concatenate(rows) - lo
+        cols = np.concatenate(cols)
+        # duplicate (row, col) pairs are summed into counts by the CSR conversion
+        block = sp.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, cols)), shape=(hi - lo, num_items))
+        block.setdiag(0, k=lo)
+        block.eliminate_zeros()
+        if normalize:
+            # cosine, counts over the square root of both items' frequencies
+            block = sp.diags(1 / scale[lo:hi].clip(min=1)) @ block @ sp.diags(1 / scale.clip(min=1))
+        blocks.append(block.tocsr() if top_n is None else prune(block, top_n))
+    return sp.vstack(blocks, format='csr') if blocks else sp.csr_matrix((num_items, num_items), dtype=np.float32)
+
+
+def prune(matrix, top_n):
+    """Keeps the `top_n` largest entries of every row of a CSR matrix."""
+    matrix = matrix.tocoo()
+    order = np.lexsort((-matrix.data, matrix.row))
+    rows, cols, data = matrix.row[order], matrix.col[order], matrix.data[order]
+    rank = np.arange(len(rows)) - np.searchsorted(rows, rows)
+    keep = rank < top_n
+    return sp.csr_matrix((data[keep], (rows[keep], cols[keep])), shape=matrix.shape)
+
+
+def history_matrix(histories, num_items):
+    """Binary user x item CSR matrix with one row per history."""
+    lengths = np.fromiter(map(len, histories), dtype=np.int64, count=len(histories))
+    indices = np.fromiter(itertools.chain.from_iterable(histories), dtype=np.int64, count=lengths.sum())
+    matrix = sp.csr_matrix((np.ones(len(indices), dtype=np.float32), indices, np.concatenate([[0], np.cumsum(lengths)])),
+                           shape=(len(histories), num_items))
+    matrix.sum_duplicates()
+    matrix.data[:] = 1
+    return matrix
+
+
+def knn_scores(similarity, histories, candidates, chunk_size=65536):
+    """Summed similarity of every candidate to its user's history, an array of the shape of `candidates`."""
+    candidates = np.asarray(candidates)
+    num_candidates = candidates.shape[1]
+    scores = np.zeros(candidates.shape, dtype=np.float32)
+    # blocks of users bound the size of the pair arrays
+    for start in range(0, len(candidates), chunk_size):
+        block = candidates[start:start + chunk_size]
+        lengths = np.fromiter(map(len, histories[start:start + chunk_size]), dtype=np.int64, count=len(block))
+        if lengths.sum() == 0:
+            continue
+        history = np.fromiter(itertools.chain.from_iterable(histories[start:start + chunk_size]), dtype=np.int64, count=lengths.sum())
+        # one (history item, candidate) pair per entry, looked up in the similarity matrix all at once
+        owner = np.repeat(np.arange(len(block)), lengths)
+        values = np.asarray(similarity[np.repeat(history, num_candidates), block[owner].ravel()]).ravel()
+        slots = (owner[:, None] * num_candidates + np.arange(num_candidates)).ravel()
+        scores[start:start + len(block)] = np.bincount(slots, weights=values, minlength=block.size).reshape(block.shape)
+    return scores
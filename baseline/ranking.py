@@ -0,0 +1,39 @@
+"""
+Rankings of the whole candidate matrix at once, for the non-LLM baselines and
+for per-candidate model scores.
+
+`candidates` is an (num_users, num_candidates) array of item codes in the order
+they were shown to the model. Every function returns the same matrix with each
+row reordered from most to least recommended.
+"""
+
+import numpy as np
+
+
+def score_ranking(candidates, scores, tiebreak=None):
+    """
+    Orders by descending score, ties keep their shown order. `scores` has the shape of `candidates`,
+    so does `tiebreak`, which orders equal scores by descending tiebreak when given.
+    """
+    if tiebreak is None:
+        order = np.argsort(-np.asarray(scores), axis=1, kind='stable')
+    else:
+        order = np.lexsort((-np.asarray(tiebreak), -np.asarray(scores)), axis=-1)
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+def popularity_ranking(candidates, popularity):
+    """Orders by descending popularity, equally popular items keep their shown order."""
+    return score_ranking(candidates, popularity[candidates])
+
+
+def random_ranking(candidates, seed=None):
+    """Shuffles every row independently with a generator seeded by `seed`."""
+    rng = np.random.default_rng(seed)
+    return rng.permuted(candidates, axis=1)
+
+
+def target_ranks(ranked, targets):
+    """1-based position of every row's target, 0 where the target is missing."""
+    hits = ranked == np.asarray(targets)[:, None]
+    return np.where(hits.any(1), hits.argmax(1) + 1, 0)
@@ -0,0 +1,288 @@
+"""
+Offline benchmark of the loaders, preprocessing, metrics and request pipeline.
+
+Every stage runs on synthetic MovieLens files (see benchmarks/synthetic.py),
+once under tracemalloc for its peak Python/NumPy memory and `--repeat` times for
+its best wall time. The dataset scripts are driven through their builders'
+`_generate_examples` on the synthetic files, and the request stage talks to an
+in-process stub endpoint with a configurable latency, so nothing needs network.
+
+Results can be saved as a baseline and later runs compared against it; stages
+that got slower or bigger than the tolerance are flagged and the exit code is 1:
+
+    python -m benchmarks.run --scales 100k 1m --save
+    python -m benchmarks.run --scales 100k 1m
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import time
+import tracemalloc
+
+import datasets
+import numpy as np
+import openai
+import pyarrow as pa
+from omegaconf import OmegaConf
+
+from baseline.knn import item_similarity, knn_scores, training_interactions
+from benchmarks.synthetic import SCALES, make_dataset
+from llm.engine import ChatEngine
+from llm.stub_server import serve
+from metric.ndcg import ndcg
+from metric.ranking import summarize
+from metric.stream import StreamingNDCG
+from utils.prompt import PromptTemplate, render_batch
+from utils.vocab import ItemTable
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STAGES = {}
+
+
+def stage(name):
+    def register(fn):
+        STAGES[name] = fn
+        return fn
+    return register
+
+
+def script_module(builder):
+    return sys.modules[type(builder).__module__]
+
+
+def requires(ctx, *keys):
+    # Stages build on the outputs of earlier ones, produce them untimed when a stage runs alone
+    for key in keys:
+        if key not in ctx:
+            STAGES[PRODUCERS[key]](ctx)
+
+
+### stages, each returns the number of items it processed ###
+
+@stage("ratings_convert")
+def ratings_convert(ctx):
+    shutil.rmtree(ctx["ratings_path"] + ".columns", ignore_errors=True)
+    return len(script_module(ctx["seq_builder"]).open_ratings(ctx["ratings_path"])["uid"])
+
+
+@stage("ratings_open")
+def ratings_open(ctx):
+    ctx["ratings"] = script_module(ctx["seq_builder"]).open_ratings(ctx["ratings_path"])
+    return len(ctx["ratings"]["uid"])
+
+
+@stage("rating_rows")
+def rating_rows(ctx):
+    # The `data` config of ml100k.py, consumed without building a dataset
+    return sum(1 for _ in ctx["data_builder"]._generate_examples(ctx["ratings_path"], "data"))
+
+
+@stage("seq_split")
+def seq_split(ctx):
+    ctx["test"] = [example for _, example in ctx["seq_builder"]._generate_examples(ctx["ratings_path"], "test")]
+    return len(ctx["test"])
+
+
+@stage("seq_windows")
+def seq_windows(ctx):
+    # every sliding window of the test split, consumed one example at a time as a streamed split would be
+    return sum(1 for _ in ctx["window_builder"]._generate_examples(ctx["ratings_path"], "test"))
+
+
+@stage("item_table")
+def item_table(ctx):
+    requires(ctx, "ratings")
+    item = datasets.Dataset.from_list([e for _, e in ctx["item_builder"]._generate_examples(ctx["item_path"], "data")],
+                                      features=ctx["item_builder"].info.features)
+    data = datasets.Dataset(pa.table({"iid": pa.array(ctx["ratings"]["iid"]).cast(pa.string())}))
+    ctx["items"] = ItemTable(item, data)
+    return len(data)
+
+
+@stage("render")
+def render(ctx):
+    requires(ctx, "test", "items")
+    test = datasets.Dataset.from_list(ctx["test"])
+    rendered = test.map(render_batch, batched=True, batch_size=1000, keep_in_memory=True, load_from_cache_file=False,
+                        fn_kwargs={"vocab": ctx["items"].vocab, "titles": ctx["items"].titles,
+                                   "prompt": ctx["template"]["prompt"], "seed": 0})
+    ctx["prompts"] = rendered["prompt"]
+    return len(rendered)
+
+
+@stage("ndcg_stream")
+def ndcg_stream(ctx):
+    metric = StreamingNDCG(k=[1, 5, 10])
+    metric.add_batch(ctx["ranks"])
+    metric.compute()
+    return len(ctx["ranks"])
+
+
+@stage("ndcg_evaluate")
+def ndcg_evaluate(ctx):
+    # The evaluate metric in metric/ndcg.py, fed one-hot relevance vectors in ranked order
+    predictions = np.zeros((len(ctx["ranks"]), 11))
+    predictions[np.arange(len(ctx["ranks"])), ctx["ranks"] - 1] = 1
+    ctx["ndcg_metric"].compute(predictions=predictions, references=predictions, k=[1, 5, 10])
+    return len(ctx["ranks"])
+
+
+@stage("ndcg_plain")
+def ndcg_plain(ctx):
+    # The same computation called as a plain function, without evaluate's Arrow round trip
+    predictions = np.zeros((len(ctx["ranks"]), 11))
+    predictions[np.arange(len(ctx["ranks"])), ctx["ranks"] - 1] = 1
+    ndcg(predictions, k=[1, 5, 10])
+    return len(ctx["ranks"])
+
+
+@stage("bootstrap")
+def bootstrap(ctx):
+    summarize(ctx["ranks"], k=[1, 5, 10], num_resamples=1000)
+    return len(ctx["ranks"])
+
+
+@stage("knn_similarity")
+def knn_similarity(ctx):
+    requires(ctx, "ratings", "items")
+    ratings = ctx["ratings"]
+    users, items = training_interactions(np.asarray(ratings["uid"]), ctx["items"].vocab.encode(ratings["iid"]),
+                                         np.asarray(ratings["timestamp"]))
+    ctx["similarity"] = item_similarity(users, items, len(ctx["items"]))
+    return len(users)
+
+
+@stage("knn_rank")
+def knn_rank(ctx):
+    requires(ctx, "test", "items", "similarity")
+    if "knn_inputs" not in ctx:
+        # item codes as main.py gets them from rendering, converted once outside the timed runs
+        vocab = ctx["items"].vocab
+        ctx["knn_inputs"] = ([vocab.encode(e["seq"]).tolist() for e in ctx["test"]],
+                             vocab.encode([e["candidates"] + [e["target"]] for e in ctx["test"]]))
+    histories, candidates = ctx["knn_inputs"]
+    knn_scores(ctx["similarity"], histories, candidates)
+    return len(candidates)
+
+
+@stage("requests")
+def requests(ctx):
+    requires(ctx, "prompts")
+    prompts = ctx["prompts"][:ctx["num_requests"]]
+    system = PromptTemplate(ctx["template"]["system"]).render(NUM_CANDIDATES=len(ctx["test"][0]["candidates"]) + 1)
+    engine = ChatEngine(system=system, api_base=ctx["api_base"], concurrency=ctx["concurrency"],
+                        requests_per_minute=None, tokens_per_minute=None, max_retries=1)
+    failed = [error for _, error in engine.run(prompts, desc="Benchmark requests") if error is not None]
+    if failed:
+        raise RuntimeError(f"{len(failed)} benchmark requests failed, first error: {failed[0]!r}")
+    return len(prompts)
+
+
+# stage that puts each shared value into the context
+PRODUCERS = {"ratings": "ratings_open", "test": "seq_split", "items": "item_table", "prompts": "render",
+             "similarity": "knn_similarity"}
+
+
+def measure(fn, ctx, repeat):
+    tracemalloc.start()
+    fn(ctx)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = fn(ctx)
+        seconds.append(time.perf_counter() - start)
+    best = min(seconds)
+    return {"seconds": best, "peak_mb": peak / 2 ** 20, "items": count, "items_per_second": count / best if best else None}
+
+
+def run_scale(scale, args):
+    data_dir = make_dataset(args.data_dir, scale, args.seed)
+    ctx = {
+        "ratings_path": os.path.join(data_dir, "u.data"),
+        "item_path": os.path.join(data_dir, "u.item"),
+        "seq_builder": datasets.load_dataset_builder(os.path.join(ROOT, "datasets", "ml100k_seq.py"), "100k", sampler=args.sampler),
+        "window_builder": datasets.load_dataset_builder(os.path.join(ROOT, "datasets", "ml100k_seq.py"), "100k",
+                                                        sampler=args.sampler, window_stride=1),
+        "data_builder": datasets.load_dataset_builder(os.path.join(ROOT, "datasets", "ml100k.py"), "data"),
+        "item_builder": datasets.load_dataset_builder(os.path.join(ROOT, "datasets", "ml100k.py"), "item"),
+        # the template's prompt field, rendered as main.py renders it
+        "template": OmegaConf.load(os.path.join(ROOT, "config", "template", "t1.yaml")),
+        "ndcg_metric": args.ndcg_metric,
+        "ranks": np.random.default_rng(args.seed).integers(1, 12, SCALES[scale][0]),
+        "api_base": args.api_base,
+        "num_requests": args.requests,
+        "concurrency": args.concurrency,
+    }
+    results = {}
+    for name in args.stages:
+        if name == "ndcg_evaluate" and args.ndcg_metric is None:
+            continue
+        results[name] = measure(STAGES[name], ctx, args.repeat)
+        print(f"{scale:>5} {name:<16} {results[name]['seconds']:9.4f}s {results[name]['peak_mb']:9.1f} MB")
+    return results
+
+
+def compare(results, baseline, tolerance, min_seconds=0.05, min_mb=5.0):
+    """Stages slower or bigger than baseline * (1 + tolerance), ignoring differences below the noise floor."""
+    flags = []
+    for scale, stages in results.items():
+        for name, now in stages.items():
+            before = baseline.get(scale, {}).get(name)
+            if before is None:
+                continue
+            if now["seconds"] > before["seconds"] * (1 + tolerance) and now["seconds"] - before["seconds"] > min_seconds:
+                flags.append(f"{scale} {name}: {before['seconds']:.4f}s -> {now['seconds']:.4f}s")
+            if now["peak_mb"] > before["peak_mb"] * (1 + tolerance) and now["peak_mb"] - before["peak_mb"] > min_mb:
+                flags.append(f"{scale} {name}: {before['peak_mb']:.1f} MB -> {now['peak_mb']:.1f} MB")
+    return flags
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark loaders, preprocessing, metrics and requests on synthetic data")
+    parser.add_argument("--scales", nargs="+", default=["100k", "1m"], choices=list(SCALES))
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=list(STAGES))
+    parser.add_argument("--data_dir", default=os.path.join(ROOT, "benchmarks", "data"))
+    parser.add_argument("--baseline", default=os.path.join(ROOT, "benchmarks", "baseline.json"))
+    parser.add_argument("--save", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slowdown or growth")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sampler", default="uniform")
+    parser.add_argument("--requests", type=int, default=200, help="prompts sent to the stub endpoint")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.05, help="stub endpoint latency in seconds")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    server = serve(port=args.port, latency=args.latency)
+    args.api_base = f"http://127.0.0.1:{args.port}/v1"
+    # The stub accepts any key
+    openai.api_key = openai.api_key or "benchmark"
+    try:
+        import evaluate
+        args.ndcg_metric = evaluate.load(os.path.join(ROOT, "metric", "ndcg.py"))
+    except ImportError:
+        args.ndcg_metric = None
+
+    results = {scale: run_scale(scale, args) for scale in args.scales}
+    server.shutdown()
+
+    report = {"machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+              "results": results}
+    if args.save:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        flags = compare(results, json.load(open(args.baseline))["results"], args.tolerance)
+        print("Regressions:" if flags else f"No regressions against {args.baseline}")
+        for flag in flags:
+            print(f"  {flag}")
+        sys.exit(1 if flags else 0)
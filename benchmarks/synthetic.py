@@ -0,0 +1,112 @@
+"""
+Synthetic MovieLens files for offline benchmarks.
+
+Writes `u.data` (tab separated uid, iid, rating, timestamp) and `u.item` (pipe
+separated id, title, dates, URL and 19 genre flags) in the layout of the ml-100k
+archive, at about the user, item and rating counts of MovieLens 100k, 1M and 25M.
+Every user rates at least 20 distinct items, activity is log-normal and item
+popularity follows a Zipf-like law, so sorting, grouping and sampling costs
+look like the real data.
+
+    python -m benchmarks.synthetic ./bench_data --scales 100k 1m
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+
+# (users, items, ratings) of the real releases
+SCALES = {
+    "100k": (943, 1682, 100_000),
+    "1m": (6040, 3706, 1_000_209),
+    "25m": (162_541, 59_047, 25_000_095),
+}
+
+GENRES = 19
+MIN_RATINGS = 20
+
+
+def user_counts(num_users, num_ratings, rng):
+    counts = rng.lognormal(0, 1, num_users)
+    counts = MIN_RATINGS + np.floor(counts / counts.sum() * (num_ratings - MIN_RATINGS * num_users)).astype(np.int64)
+    counts[:num_ratings - counts.sum()] += 1
+    return counts
+
+
+def draw_distinct(counts, cdf, rng):
+    """`counts[u]` distinct items for every user u, drawn from the item cdf. Returns (users, items)."""
+    num_items = len(cdf)
+    keys = np.empty(0, dtype=np.int64)
+    need = counts.copy()
+    # Draw with replacement and drop duplicates until every user has enough distinct items
+    while need.any():
+        users = np.repeat(np.arange(len(counts)), need)
+        items = np.minimum(np.searchsorted(cdf, rng.random(len(users))), num_items - 1)
+        keys = np.unique(np.concatenate([keys, users * num_items + items]))
+        need = counts - np.bincount(keys // num_items, minlength=len(counts))
+    return keys // num_items, keys % num_items
+
+
+def write_ratings(path, num_users, num_items, num_ratings, seed=0, chunk_users=20_000):
+    rng = np.random.default_rng(seed)
+    # Capped at half the catalog so drawing distinct items never turns into collecting every coupon
+    counts = np.minimum(user_counts(num_users, num_ratings, rng), num_items // 2)
+    popularity = 1 / np.arange(1, num_items + 1) ** 0.8
+    cdf = np.cumsum(popularity[rng.permutation(num_items)])
+    cdf /= cdf[-1]
+
+    with open(path, "w") as f:
+        for start in range(0, num_users, chunk_users):
+            users, items = draw_distinct(counts[start:start + chunk_users], cdf, rng)
+            block = pd.DataFrame({
+                "uid": users + start + 1,
+                "iid": items + 1,
+                "rating": rng.integers(1, 6, len(users)),
+                "timestamp": 874_724_710 + rng.integers(0, 20_000_000, len(users)),
+            })
+            block.to_csv(f, sep="\t", header=False, index=False)
+    return int(counts.sum())
+
+
+def write_items(path, num_items, seed=0):
+    rng = np.random.default_rng(seed)
+    ids = np.arange(1, num_items + 1)
+    years = rng.integers(1920, 1999, num_items)
+    frame = pd.DataFrame({
+        "iid": ids,
+        "title": [f"Synthetic Movie {i} ({y})" for i, y in zip(ids, years)],
+        "release": [f"01-Jan-{y}" for y in years],
+        "video_release": "",
+        "URL": [f"http://example.com/movie/{i}" for i in ids],
+    })
+    genres = rng.random((num_items, GENRES)) < 0.15
+    for g in range(GENRES):
+        frame[f"g{g}"] = genres[:, g].astype(int)
+    frame.to_csv(path, sep="|", header=False, index=False, encoding="latin-1")
+
+
+def make_dataset(root, scale, seed=0):
+    """Writes ml-<scale>/u.data and u.item under `root` unless present, returns the directory."""
+    num_users, num_items, num_ratings = SCALES[scale]
+    data_dir = os.path.join(root, f"ml-{scale}")
+    os.makedirs(data_dir, exist_ok=True)
+    if not os.path.exists(os.path.join(data_dir, "u.item")):
+        write_items(os.path.join(data_dir, "u.item"), num_items, seed)
+    if not os.path.exists(os.path.join(data_dir, "u.data")):
+        # Written under a temporary name so an interrupted run is never mistaken for a full file
+        write_ratings(os.path.join(data_dir, "u.data.tmp"), num_users, num_items, num_ratings, seed)
+        os.replace(os.path.join(data_dir, "u.data.tmp"), os.path.join(data_dir, "u.data"))
+    return data_dir
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("root")
+    parser.add_argument("--scales", nargs="+", default=["100k"], choices=list(SCALES))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    for scale in args.scales:
+        print(f"Wrote {make_dataset(args.root, scale, args.seed)}")
@@ -25,6 +25,8 @@ import os
 
 import datasets
 
+from .ratings import iter_rows, open_ratings
+
 
 _CITATION = """\
 @article{10.1145/2827872, author = {Harper, F. Maxwell and Konstan, Joseph A.}, 
@@ -201,16 +203,16 @@ class ML100k(datasets.GeneratorBasedBuilder):
         # TODO: This method handles input defined in _split_generators to yield (key, example) tuples from the dataset.
         # The `key` is for legacy reasons (tfds) and is not important in itself, but must be unique for each example.
         if self.config.name == "data":
-            with open(filepath, encoding="utf-8") as f:
-                for key, row in enumerate(f):
-                    data = row.split("\t")
-                    # Yields examples as (key, example) tuples
-                    yield key, {
-                        "uid": data[0],
-                        "iid": data[1],
-                        "rating": data[2],
-                        "timestamp": data[3],   
-                    }
+            # Typed columns are converted once and memory-mapped on later runs
+            ratings = open_ratings(filepath)
+            for key, (uid, iid, rating, timestamp) in enumerate(iter_rows(ratings)):
+                # Yields examples as (key, example) tuples
+                yield key, {
+                    "uid": str(uid),
+                    "iid": str(iid),
+                    "rating": rating,
+                    "timestamp": timestamp,
+                }
         elif self.config.name == "item":
             with open(filepath, encoding="latin-1") as f:
                 for key, row in enumerate(f):
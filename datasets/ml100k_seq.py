@@ -22,11 +22,14 @@ The original dataset is available at https://grouplens.org/datasets/movielens/10
 import csv
 import json
 import os
+import numpy as np
 import pandas as pd
-import random
 
 import datasets
 
+from .ratings import open_ratings
+from .sampler import build_sampler
+
 
 _CITATION = """\
 @article{10.1145/2827872, author = {Harper, F. Maxwell and Konstan, Joseph A.}, 
@@ -90,11 +93,46 @@ _URLS = {
 }
 
 
+class ML100kSeqConfig(datasets.BuilderConfig):
+    """BuilderConfig for ML100kSeq with the negative candidate sampling options."""
+
+    def __init__(self, sampler="uniform", num_negatives=10, seed=42, popularity_alpha=1.0,
+                 cooccurrence_window=5, cooccurrence_top_n=50, hard_fraction=0.5,
+                 window_length=9, window_stride=None, **kwargs):
+        """
+        Args:
+            sampler: negative sampling strategy, one of `uniform`, `popularity` or `cooccurrence`.
+            num_negatives: number of negative candidates drawn per user.
+            seed: base seed, every (user, split) draws from a generator derived from it.
+            popularity_alpha: exponent applied to item counts by the `popularity` sampler.
+            cooccurrence_window: sequence distance within which items count as co-occurring.
+            cooccurrence_top_n: neighbours kept per item by the `cooccurrence` sampler.
+            hard_fraction: share of negatives drawn from co-occurring items, rest is uniform.
+            window_length: history length of the sliding windows.
+            window_stride: None yields one sample per user and split. An integer yields every
+                (window_length history, next item) pair of the split, keeping every
+                `window_stride`-th window counted back from the user's last one. Windowed
+                examples carry `position`, the index of the target in the user's ratings.
+            **kwargs: keyword arguments forwarded to super.
+        """
+        super().__init__(**kwargs)
+        self.sampler = sampler
+        self.num_negatives = num_negatives
+        self.seed = seed
+        self.popularity_alpha = popularity_alpha
+        self.cooccurrence_window = cooccurrence_window
+        self.cooccurrence_top_n = cooccurrence_top_n
+        self.hard_fraction = hard_fraction
+        self.window_length = window_length
+        self.window_stride = window_stride
+
+
 # TODO: Name of the dataset usually matches the script name with CamelCase instead of snake_case
 class ML100kSeq(datasets.GeneratorBasedBuilder):
     """This is modified version of MovieLens 100k dataset. It is a sequence of items rated by users."""
 
-    VERSION = datasets.Version("1.0.0")
+    # 1.1.0: ids are emitted as integer MovieLens ids instead of strings
+    VERSION = datasets.Version("1.1.0")
 
     # This is an example of a dataset with multiple configurations.
     # If you don't want/need to define several sub-sets in your dataset,
@@ -102,10 +140,10 @@ class ML100kSeq(datasets.GeneratorBasedBuilder):
 
     # If you need to make complex sub-parts in the datasets with configurable options
     # You can create your own builder configuration class to store attribute, inheriting from datasets.BuilderConfig
-    # BUILDER_CONFIG_CLASS = MyBuilderConfig
+    BUILDER_CONFIG_CLASS = ML100kSeqConfig
 
     BUILDER_CONFIGS = [
-        datasets.BuilderConfig(name="100k", version=VERSION, description="This is the 100k version of the dataset"),
+        ML100kSeqConfig(name="100k", version=VERSION, description="This is the 100k version of the dataset"),
     ]
 
     # DEFAULT_CONFIG_NAME = "100k"  # It's not mandatory to have a default configuration. Just use one if it make sense.
@@ -114,12 +152,14 @@ class ML100kSeq(datasets.GeneratorBasedBuilder):
         if self.config.name == "100k":  # This is the name of the configuration selected in BUILDER_CONFIGS above
             features = datasets.Features(
                 {
-                    "uid": datasets.Value("string"),
-                    "seq": datasets.Sequence(datasets.Value("string")),
-                    "candidates": datasets.Sequence(datasets.Value("string")),
-                    "target": datasets.Value("string"),
+                    "uid": datasets.Value("int32"),
+                    "seq": datasets.Sequence(datasets.Value("int32")),
+                    "candidates": datasets.Sequence(datasets.Value("int32")),
+                    "target": datasets.Value("int32"),
                 }
             )
+            if self.config.window_stride is not None:
+                features["position"] = datasets.Value("int32")
 
         return datasets.DatasetInfo(
             description=_DESCRIPTION,
@@ -140,6 +180,9 @@ class ML100kSeq(datasets.GeneratorBasedBuilder):
         # It can accept any type or nested list/dict and will give back the same structure with the url replaced with path to local files.
         # By default the archives will be extracted and a path to a cached folder where they are extracted is returned instead of the archive
         urls = _URLS[self.config.name]
+        if dl_manager.is_streaming:
+            # The rating store memory-maps a local copy, so even a streamed split downloads the small archive once
+            dl_manager = datasets.DownloadManager(self.name, download_config=dl_manager.download_config)
         data_dir = dl_manager.download_and_extract(urls)
         return [
             datasets.SplitGenerator(
@@ -172,39 +215,104 @@ class ML100kSeq(datasets.GeneratorBasedBuilder):
     def _generate_examples(self, filepath, split):
         # TODO: This method handles input defined in _split_generators to yield (key, example) tuples from the dataset.
         # The `key` is for legacy reasons (tfds) and is not important in itself, but must be unique for each example.
-        with open(filepath, encoding="utf-8") as f:
-            lines = f.readlines()
-            for i in range(len(lines)):
-                lines[i] = lines[i].strip().split('\t')
-            df = pd.DataFrame(lines, index=None, columns=['uid', 'iid', 'rating', 'timestamp'])
-        iid_list = df["iid"].unique()
-        for uid in df["uid"].unique():
-            sub_df = df.loc[df['uid'] == uid].sort_values(by='timestamp')
-            sub_iid_list = list(sub_df['iid'])
-
-            candidates = random.sample([item for item in iid_list if item not in sub_iid_list], 10)
-            if len(candidates) < 10:
+        ratings = open_ratings(filepath)
+        # Integer codes in order of first appearance, so users come out in file order
+        uid_codes, uids = pd.factorize(ratings['uid'])
+        iid_codes, iids = pd.factorize(ratings['iid'])
+        uid_codes = uid_codes.astype(np.int32)
+        iid_codes = iid_codes.astype(np.int32)
+        iids = np.asarray(iids)
+
+        # One sort by (uid, timestamp) instead of filtering the frame per user
+        order = np.lexsort((ratings['timestamp'], uid_codes))
+        users = uid_codes[order]
+        items = iid_codes[order]
+        bounds = np.flatnonzero(np.diff(users)) + 1
+        starts = np.concatenate([[0], bounds])
+        ends = np.concatenate([bounds, [len(users)]])
+
+        sampler = build_sampler(
+            self.config.sampler, users, items, len(uids), len(iids),
+            seed=self.config.seed,
+            alpha=self.config.popularity_alpha,
+            window=self.config.cooccurrence_window,
+            top_n=self.config.cooccurrence_top_n,
+            hard_fraction=self.config.hard_fraction,
+        )
+
+        if self.config.window_stride is not None:
+            yield from self._generate_windows(users, items, uids, iids, starts, ends, sampler, split)
+            return
+
+        for code, start, end in zip(users[starts], starts, ends):
+            uid = int(uids[code])
+            sub_iid_list = items[start:end]
+
+            context = sub_iid_list[-10:-1] if split == "test" else sub_iid_list[-10:-2]
+            candidates = sampler.sample(code, context, self.config.num_negatives, sampler.rng(uid, split))
+            if candidates is None:
                 continue
+            candidates = iids[candidates].tolist()
             # list(sub.loc[sub['rating'] == '1']['iid'])
             if split == "train":
                 yield uid, {
                         "uid": uid,
-                        "seq": sub_iid_list[-10:-2],
+                        "seq": iids[sub_iid_list[-10:-2]].tolist(),
                         "target": None,
                         "candidates": candidates
                     }
             elif split == "validation":
                 yield uid, {
                         "uid": uid,
-                        "seq": sub_iid_list[-10:-2],
-                        "target": sub_iid_list[-2],
+                        "seq": iids[sub_iid_list[-10:-2]].tolist(),
+                        "target": int(iids[sub_iid_list[-2]]),
                         "candidates": candidates
                     }
             elif split == "test":
                 yield uid, {
                         "uid": uid,
-                        "seq": sub_iid_list[-10:-1],
-                        "target": sub_iid_list[-1],
+                        "seq": iids[sub_iid_list[-10:-1]].tolist(),
+                        "target": int(iids[sub_iid_list[-1]]),
                         "candidates": candidates
                     }
 
+    def _generate_windows(self, users, items, uids, iids, starts, ends, sampler, split):
+        """
+        Every (history window, next item) pair of the split. The windows are a zero-copy
+        stride-tricks view of the sorted item array, and examples are built one at a time as
+        they are consumed, so a streamed split never holds them all in memory.
+        """
+        length = self.config.window_length
+        if len(items) <= length:
+            return
+        # the last `skip` items of every user belong to later splits
+        skip = {"train": 2, "validation": 1, "test": 0}[split]
+        windows = np.lib.stride_tricks.sliding_window_view(items, length + 1)
+        count = len(windows)
+        group = np.repeat(np.arange(len(starts)), ends - starts)[:count]
+        # items of the user after the window's target, counted back in steps of the stride
+        left = ends[group] - np.arange(count) - length - 1
+        valid = (users[:count] == users[length:]) & (left >= skip) & ((left - skip) % self.config.window_stride == 0)
+        selected = np.flatnonzero(valid)
+        positions = selected + length - starts[group[selected]]
+        # the windows of one user are consecutive, their negatives come from one generator and call
+        bounds = np.flatnonzero(np.diff(group[selected])) + 1
+        for run in np.split(np.arange(len(selected)), bounds):
+            if len(run) == 0:
+                continue
+            w = selected[run]
+            code = users[w[0]]
+            uid = int(uids[code])
+            negatives = sampler.sample_many(code, windows[w, :-1], self.config.num_negatives, sampler.rng(uid, f"{split}/windows"))
+            seqs = iids[windows[w, :-1]].tolist()
+            targets = iids[windows[w, -1]].tolist()
+            for position, seq, target, candidates in zip(positions[run].tolist(), seqs, targets, negatives):
+                if candidates is None:
+                    continue
+                yield f"{uid}-{position}", {
+                    "uid": uid,
+                    "seq": seq,
+                    "target": int(target),
+                    "candidates": iids[candidates].tolist(),
+                    "position": position,
+                }
@@ -0,0 +1,126 @@
+"""
+Columnar, memory-mapped store for MovieLens style rating files.
+
+The first time a rating file is used it is parsed in chunks straight into typed
+`.npy` column files (uid, iid, rating, timestamp) next to the source file. Later
+runs open those columns as read-only memory maps, so nothing is parsed
+again and the columns are only paged in as they are read.
+"""
+
+import json
+import os
+import shutil
+import uuid
+
+import numpy as np
+import pandas as pd
+
+
+COLUMNS = {
+    "uid": np.int32,
+    "iid": np.int32,
+    "rating": np.int32,
+    "timestamp": np.int64,
+}
+
+
+def _count_rows(filepath, header=False):
+    rows = 0
+    last = b"\n"
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(1 << 24), b""):
+            rows += block.count(b"\n")
+            last = block[-1:]
+    if last != b"\n":
+        rows += 1
+    return rows - int(header)
+
+
+def _source_meta(filepath):
+    stat = os.stat(filepath)
+    return {"source_size": stat.st_size, "source_mtime_ns": stat.st_mtime_ns}
+
+
+def _is_current(out_dir, filepath):
+    meta_path = os.path.join(out_dir, "meta.json")
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path) as f:
+        meta = json.load(f)
+    return all(meta.get(k) == v for k, v in _source_meta(filepath).items())
+
+
+def convert(filepath, out_dir, sep="\t", header=False, chunksize=1 << 20):
+    """
+    Parses `filepath` chunk by chunk into one `.npy` file per column in `out_dir`.
+    Every conversion writes its own temporary directory, so processes converting the same
+    file at once (shards, sweep workers on a cold cache) never touch each other's files,
+    and when another one has already put an up to date copy in place that copy is kept.
+    """
+    rows = _count_rows(filepath, header)
+    tmp_dir = f"{out_dir}.{os.getpid()}-{uuid.uuid4().hex[:8]}.tmp"
+    os.makedirs(tmp_dir)
+
+    columns = {
+        name: np.lib.format.open_memmap(os.path.join(tmp_dir, f"{name}.npy"), mode="w+", dtype=dtype, shape=(rows,))
+        for name, dtype in COLUMNS.items()
+    }
+    reader = pd.read_csv(
+        filepath, sep=sep, header=0 if header else None, names=list(COLUMNS),
+        dtype=COLUMNS, chunksize=chunksize,
+    )
+    offset = 0
+    for chunk in reader:
+        for name, column in columns.items():
+            column[offset:offset + len(chunk)] = chunk[name].to_numpy()
+        offset += len(chunk)
+    for column in columns.values():
+        column.flush()
+    del columns
+    if offset != rows:
+        raise ValueError(f"Expected {rows} rows in {filepath}, parsed {offset}")
+
+    with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+        json.dump(dict(_source_meta(filepath), rows=rows), f)
+    for _ in range(2):
+        if _is_current(out_dir, filepath):
+            # another process got there first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+        if os.path.exists(out_dir):
+            # a stale copy is renamed away first, os.replace cannot overwrite a non-empty directory
+            stale = f"{out_dir}.{os.getpid()}-{uuid.uuid4().hex[:8]}.stale"
+            try:
+                os.replace(out_dir, stale)
+                shutil.rmtree(stale, ignore_errors=True)
+            except FileNotFoundError:
+                pass
+        try:
+            os.replace(tmp_dir, out_dir)
+            return
+        except OSError:
+            # out_dir reappeared in between, written by another process
+            continue
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    if not _is_current(out_dir, filepath):
+        raise OSError(f"Could not put the columns of {filepath} in place at {out_dir}")
+
+
+def open_ratings(filepath, out_dir=None, sep="\t", header=False):
+    """
+    Returns a dict of read-only memory-mapped columns for the rating file, converting
+    it first if there is no up to date columnar copy in `out_dir`.
+    """
+    out_dir = out_dir or filepath + ".columns"
+    if not _is_current(out_dir, filepath):
+        convert(filepath, out_dir, sep=sep, header=header)
+    # open_memmap instead of np.load, which `datasets` patches for streaming in dataset scripts
+    return {name: np.lib.format.open_memmap(os.path.join(out_dir, f"{name}.npy"), mode="r") for name in COLUMNS}
+
+
+def iter_rows(ratings, chunksize=1 << 16):
+    """Yields (uid, iid, rating, timestamp) tuples of Python ints, one chunk in memory at a time."""
+    rows = len(ratings["uid"])
+    for start in range(0, rows, chunksize):
+        chunk = [ratings[name][start:start + chunksize].tolist() for name in COLUMNS]
+        yield from zip(*chunk)
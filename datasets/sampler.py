@@ -0,0 +1,228 @@
+"""
+Negative candidate samplers for the sequential MovieLens datasets.
+
+Items and users are integer codes. The items every user has interacted with are
+kept once in a compact CSR style ExclusionIndex, and each (user, split) pair draws
+from its own generator derived from the global seed, so candidates are identical
+across builder runs and independent of the order users are processed in.
+
+Strategies:
+    uniform:      every unseen item is equally likely
+    popularity:   unseen items weighted by interaction count ** alpha
+    cooccurrence: hard negatives that frequently appear close to the user's recent
+                  items in other users' sequences, topped up with uniform negatives
+"""
+
+import zlib
+
+import numpy as np
+
+
+class ExclusionIndex:
+    """Sorted, de-duplicated item codes per user stored as indptr/indices arrays."""
+
+    def __init__(self, users, items, num_users):
+        order = np.lexsort((items, users))
+        users = users[order]
+        items = items[order]
+        keep = np.ones(len(users), dtype=bool)
+        keep[1:] = (users[1:] != users[:-1]) | (items[1:] != items[:-1])
+        self.indices = items[keep].astype(np.int32)
+        self.indptr = np.zeros(num_users + 1, dtype=np.int64)
+        np.cumsum(np.bincount(users[keep], minlength=num_users), out=self.indptr[1:])
+
+    def __getitem__(self, user):
+        return self.indices[self.indptr[user]:self.indptr[user + 1]]
+
+
+def _drop_seen_and_duplicates(draw, seen):
+    if len(seen):
+        hit = seen[np.searchsorted(seen, draw).clip(max=len(seen) - 1)] == draw
+        draw = draw[~hit]
+    _, first = np.unique(draw, return_index=True)
+    return draw[np.sort(first)]
+
+
+class NegativeSampler:
+    """Uniform sampler. Subclasses change the proposal distribution via `draw` and `weights`."""
+
+    # Rejection rounds before falling back to sampling from the exact complement
+    max_rounds = 8
+
+    def __init__(self, exclusion, num_items, seed=42, **kwargs):
+        self.exclusion = exclusion
+        self.num_items = num_items
+        self.seed = seed
+
+    def rng(self, uid, split):
+        key = [self.seed, zlib.crc32(str(uid).encode("utf-8")), zlib.crc32(split.encode("utf-8"))]
+        return np.random.default_rng(key)
+
+    def draw(self, size, rng):
+        return rng.integers(0, self.num_items, size)
+
+    def weights(self, pool):
+        return None
+
+    def sample(self, user, context, k, rng, exclude=None):
+        """
+        Returns `k` distinct item codes the user has not interacted with, or None when
+        there are not enough of them. `context` is the history shown to the model.
+        """
+        seen = self.exclusion[user]
+        if exclude is not None and len(exclude):
+            seen = np.union1d(seen, exclude)
+        if self.num_items - len(seen) < k:
+            return None
+        if k == 0:
+            return np.empty(0, dtype=np.int64)
+        if 2 * len(seen) > self.num_items:
+            return self.exact(seen, k, rng)
+
+        negatives = np.empty(0, dtype=np.int64)
+        for _ in range(self.max_rounds):
+            draw = np.concatenate([negatives, self.draw(2 * (k - len(negatives)) + 8, rng)])
+            negatives = _drop_seen_and_duplicates(draw, seen)
+            if len(negatives) >= k:
+                return negatives[:k]
+        return self.exact(seen, k, rng)
+
+    def sample_many(self, user, contexts, k, rng):
+        """
+        `sample` for several histories of one user from one generator, a list with k item codes (or
+        None) per history. These negatives do not depend on the history, so the draws of all of them
+        are made and filtered at once, rows left short fall back to `sample`.
+        """
+        seen = self.exclusion[user]
+        if self.num_items - len(seen) < k:
+            return [None] * len(contexts)
+        if k == 0 or 2 * len(seen) > self.num_items:
+            return [self.sample(user, context, k, rng) for context in contexts]
+        draw = self.draw(len(contexts) * (2 * k + 8), rng).reshape(len(contexts), -1)
+        keep = np.ones(draw.shape, dtype=bool)
+        if len(seen):
+            keep = seen[np.searchsorted(seen, draw).clip(max=len(seen) - 1)] != draw
+        # repeats within a row, the stable sort keeps each value's first draw
+        order = np.argsort(draw, axis=1, kind="stable")
+        ordered = np.take_along_axis(draw, order, axis=1)
+        repeat = np.zeros(draw.shape, dtype=bool)
+        np.put_along_axis(repeat, order[:, 1:], ordered[:, 1:] == ordered[:, :-1], axis=1)
+        keep &= ~repeat
+        first = np.argsort(~keep, axis=1, kind="stable")[:, :k]
+        negatives = list(np.take_along_axis(draw, first, axis=1))
+        for i in np.flatnonzero(keep.sum(1) < k):
+            negatives[i] = self.sample(user, contexts[i], k, rng)
+        return negatives
+
+    def exact(self, seen, k, rng):
+        pool = np.setdiff1d(np.arange(self.num_items), seen, assume_unique=True)
+        return rng.choice(pool, k, replace=False, p=self.weights(pool))
+
+
+class UniformSampler(NegativeSampler):
+    pass
+
+
+class PopularitySampler(NegativeSampler):
+    def __init__(self, exclusion, num_items, seed=42, items=None, alpha=1.0, **kwargs):
+        super().__init__(exclusion, num_items, seed)
+        self.popularity = np.bincount(items, minlength=num_items).astype(np.float64) ** alpha
+        self.cdf = np.cumsum(self.popularity)
+        self.cdf /= self.cdf[-1]
+
+    def draw(self, size, rng):
+        return np.searchsorted(self.cdf, rng.random(size), side="right").clip(max=self.num_items - 1)
+
+    def weights(self, pool):
+        weights = self.popularity[pool]
+        total = weights.sum()
+        if np.count_nonzero(weights) < len(pool) or total == 0:
+            weights = weights + 1e-12
+            total = weights.sum()
+        return weights / total
+
+
+def cooccurrence_neighbors(users, items, num_items, window=5, top_n=50):
+    """
+    Counts how often two items appear within `window` steps of each other in the
+    same user's time ordered sequence and keeps the `top_n` neighbours per item.
+    `users` and `items` must be sorted by (user, timestamp). Returns CSR arrays
+    (indptr, neighbors, counts).
+    """
+    src, dst = [], []
+    for lag in range(1, window + 1):
+        same = users[lag:] == users[:-lag]
+        a = items[:-lag][same].astype(np.int64)
+        b = items[lag:][same].astype(np.int64)
+        src += [a, b]
+        dst += [b, a]
+    src = np.concatenate(src)
+    dst = np.concatenate(dst)
+    pairs, counts = np.unique(src * num_items + dst, return_counts=True)
+    src, dst = pairs // num_items, pairs % num_items
+    keep = src != dst
+    src, dst, counts = src[keep], dst[keep], counts[keep]
+
+    # Most frequent neighbours first within each item, then truncate to top_n
+    order = np.lexsort((-counts, src))
+    src, dst, counts = src[order], dst[order], counts[order]
+    rank = np.arange(len(src)) - np.searchsorted(src, src)
+    keep = rank < top_n
+    src, dst, counts = src[keep], dst[keep], counts[keep]
+
+    indptr = np.zeros(num_items + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=num_items), out=indptr[1:])
+    return indptr, dst.astype(np.int32), counts.astype(np.float64)
+
+
+class CooccurrenceSampler(NegativeSampler):
+    def __init__(self, exclusion, num_items, seed=42, users=None, items=None,
+                 window=5, top_n=50, hard_fraction=0.5, **kwargs):
+        super().__init__(exclusion, num_items, seed)
+        self.indptr, self.neighbors, self.counts = cooccurrence_neighbors(users, items, num_items, window, top_n)
+        self.hard_fraction = hard_fraction
+
+    def sample(self, user, context, k, rng, exclude=None):
+        seen = self.exclusion[user]
+        if exclude is not None and len(exclude):
+            seen = np.union1d(seen, exclude)
+        num_hard = int(round(k * self.hard_fraction))
+
+        # Score neighbours of the context items by summed co-occurrence counts
+        context = np.asarray(context, dtype=np.int64)
+        slices = [np.arange(self.indptr[i], self.indptr[i + 1]) for i in context]
+        hard = np.empty(0, dtype=np.int64)
+        if num_hard and slices:
+            positions = np.concatenate(slices)
+            pool, inverse = np.unique(self.neighbors[positions], return_inverse=True)
+            scores = np.bincount(inverse, weights=self.counts[positions])
+            unseen = ~np.isin(pool, seen, assume_unique=True)
+            pool, scores = pool[unseen], scores[unseen]
+            if len(pool) > num_hard:
+                hard = rng.choice(pool, num_hard, replace=False, p=scores / scores.sum())
+            else:
+                hard = pool
+
+        rest = super().sample(user, context, k - len(hard), rng, exclude=np.union1d(hard, seen))
+        if rest is None:
+            return None
+        return np.concatenate([hard, rest])
+
+    def sample_many(self, user, contexts, k, rng):
+        # hard negatives depend on every history
+        return [self.sample(user, context, k, rng) for context in contexts]
+
+
+SAMPLERS = {
+    "uniform": UniformSampler,
+    "popularity": PopularitySampler,
+    "cooccurrence": CooccurrenceSampler,
+}
+
+
+def build_sampler(name, users, items, num_users, num_items, seed=42, **kwargs):
+    """`users` and `items` are integer codes of all interactions sorted by (user, timestamp)."""
+    if name not in SAMPLERS:
+        raise ValueError(f"Unknown sampler {name}, expected one of {list(SAMPLERS)}")
+    exclusion = ExclusionIndex(users, items, num_users)
+    return SAMPLERS[name](exclusion, num_items, seed, users=users, items=items, **kwargs)
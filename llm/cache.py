@@ -0,0 +1,115 @@
+"""
+Persistent response cache for chat completions.
+
+Responses are stored in a single SQLite file, keyed by a hash of everything that
+determines the completion (model, endpoint, system prompt, prompt and sampling
+parameters).
+The cache is bounded in size and evicts the least recently used entries first.
+
+Modes:
+    readwrite: look up before each request and store new responses (default)
+    replay:    read-only, a miss raises CacheMiss instead of calling the API
+    off:       cache disabled
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+
+MODES = ("readwrite", "replay", "off")
+
+
+class CacheMiss(KeyError):
+    pass
+
+
+def cache_key(**request):
+    payload = json.dumps(request, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, path, mode="readwrite", max_size_mb=None):
+        if mode not in MODES:
+            raise ValueError(f"Unknown cache mode {mode}, expected one of {MODES}")
+        self.path = path
+        self.mode = mode
+        self.max_size = int(max_size_mb * 1024 * 1024) if max_size_mb else None
+        self.hits = 0
+        self.misses = 0
+        self.conn = None
+        if mode == "off":
+            return
+
+        if mode == "replay":
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"Replay mode needs an existing cache, {path} not found")
+            self.conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, isolation_level=None)
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.conn = sqlite3.connect(path, isolation_level=None)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self.size = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @property
+    def enabled(self):
+        return self.conn is not None
+
+    def get(self, key):
+        """Returns the cached response or None. In replay mode a miss raises CacheMiss."""
+        if not self.enabled:
+            return None
+        row = self.conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            if self.mode == "replay":
+                raise CacheMiss(f"No cached response for {key} in {self.path}")
+            return None
+        self.hits += 1
+        if self.mode == "readwrite":
+            self.conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+        return row[0]
+
+    def put(self, key, response):
+        if self.mode != "readwrite":
+            return
+        size = len(key) + len(response.encode("utf-8"))
+        old = self.conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO responses (key, response, size, last_used) VALUES (?, ?, ?, ?)",
+            (key, response, size, time.time()),
+        )
+        self.size += size - (old[0] if old else 0)
+        if self.max_size is not None and self.size > self.max_size:
+            self.evict()
+
+    def evict(self):
+        # Drop least recently used entries until the cache fits again.
+        while self.size > self.max_size:
+            rows = self.conn.execute("SELECT key, size FROM responses ORDER BY last_used LIMIT 64").fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.size -= size
+                if self.size <= self.max_size:
+                    break
+
+    def __len__(self):
+        if not self.enabled:
+            return 0
+        return self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
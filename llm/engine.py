@@ -0,0 +1,218 @@
+"""
+Asynchronous request engine for OpenAI compatible chat endpoints.
+
+Keeps up to `concurrency` requests in flight while respecting requests-per-minute
+and tokens-per-minute budgets. Failed requests are retried with exponential
+backoff and full jitter. Results are returned in the order of the given prompts,
+so callers can match them back to their samples regardless of completion order.
+An optional ResponseCache is consulted before every request. Request latencies,
+retries and token usage are recorded on the engine's Profiler.
+"""
+
+import asyncio
+import random
+import threading
+import time
+
+import openai
+from tqdm import tqdm
+
+from llm.cache import cache_key
+from utils.profiling import Profiler
+
+
+# Errors worth retrying. Anything else (auth, invalid request) fails immediately.
+RETRYABLE_ERRORS = (
+    openai.error.RateLimitError,
+    openai.error.APIError,
+    openai.error.APIConnectionError,
+    openai.error.ServiceUnavailableError,
+    openai.error.Timeout,
+    openai.error.TryAgain,
+    asyncio.TimeoutError,
+)
+
+
+def estimate_tokens(text):
+    # Rough estimate (~4 characters per token) used only for rate limiting.
+    return len(text) // 4 + 1
+
+
+class RateLimiter:
+    """
+    Token bucket refilled continuously at `per_minute` units per minute.
+    `acquire` reserves its amount right away and sleeps until the bucket has refilled
+    past the reservation, so waiters are served in order. The bucket is guarded by a
+    thread lock rather than an asyncio one, so engines running on other threads and
+    event loops (the jobs of a sweep) can share one limiter and one account budget.
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.available = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount=1):
+        # Requests larger than the bucket wait for a full bucket instead of forever.
+        amount = min(amount, self.capacity)
+        with self.lock:
+            self._refill()
+            self.available -= amount
+            wait = -self.available / self.rate
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def adjust(self, amount):
+        # Correct an earlier estimate once the real usage is known (may go negative).
+        with self.lock:
+            self._refill()
+            self.available = min(self.capacity, self.available - amount)
+
+
+def rate_limits(requests_per_minute=None, tokens_per_minute=None):
+    """(request limiter, token limiter), either None when its budget is not set."""
+    return (RateLimiter(requests_per_minute) if requests_per_minute else None,
+            RateLimiter(tokens_per_minute) if tokens_per_minute else None)
+
+
+class ChatEngine:
+    def __init__(self, system, model="gpt-3.5-turbo-0301", api_base=None, temperature=0,
+                 concurrency=8, requests_per_minute=None, tokens_per_minute=None,
+                 completion_tokens=64, max_retries=4, backoff_base=1.0, backoff_max=60.0,
+                 request_timeout=None, cache=None, profiler=None, limits=None):
+        """`limits` is a shared (request, token) limiter pair from `rate_limits`, by default every run gets its own."""
+        self.system = system
+        self.model = model
+        self.api_base = api_base
+        self.temperature = temperature
+        self.concurrency = concurrency
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.completion_tokens = completion_tokens
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.request_timeout = request_timeout
+        self.cache = cache
+        self.limits = limits
+        self.profiler = profiler if profiler is not None else Profiler()
+        # Own generator so jitter never disturbs the seeded global `random` state.
+        self.rng = random.Random()
+
+    def messages(self, prompt):
+        return [
+            {"role": "system", "content": self.system},
+            {"role": "user", "content": prompt},
+        ]
+
+    def backoff(self, attempt, error=None):
+        # Respect the server's Retry-After hint when there is one, up to backoff_max.
+        headers = getattr(error, "headers", None) or {}
+        retry_after = headers.get("retry-after")
+        if retry_after is not None:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        return self.rng.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def key(self, prompt):
+        # the endpoint is part of the key, so answers of a test server never replay in runs against the real API
+        # completion_tokens only budgets the rate limiter, it is not sent and does not change the answer
+        return cache_key(model=self.model, api_base=self.api_base, system=self.system, prompt=prompt,
+                         temperature=self.temperature)
+
+    async def request(self, prompt):
+        kwargs = {}
+        if self.api_base is not None:
+            kwargs["api_base"] = self.api_base
+        if self.request_timeout is not None:
+            kwargs["request_timeout"] = self.request_timeout
+        completion = await openai.ChatCompletion.acreate(
+            model=self.model,
+            messages=self.messages(prompt),
+            temperature=self.temperature,
+            **kwargs,
+        )
+        return completion
+
+    async def complete(self, prompt, limits):
+        """Returns (text, error) for one prompt after at most `max_retries` attempts."""
+        key = None
+        if self.cache is not None and self.cache.enabled:
+            key = self.key(prompt)
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.profiler.count("cache_hits")
+                return cached, None
+
+        request_limiter, token_limiter = limits
+        estimate = estimate_tokens(self.system) + estimate_tokens(prompt) + self.completion_tokens
+        error = None
+        for attempt in range(self.max_retries):
+            if request_limiter is not None:
+                await request_limiter.acquire()
+            if token_limiter is not None:
+                await token_limiter.acquire(estimate)
+            if attempt > 0:
+                self.profiler.count("retries")
+            self.profiler.count("requests")
+            start = time.perf_counter()
+            try:
+                completion = await self.request(prompt)
+            except RETRYABLE_ERRORS as e:
+                self.profiler.observe("request_seconds", time.perf_counter() - start)
+                error = e
+                if attempt + 1 < self.max_retries:
+                    await asyncio.sleep(self.backoff(attempt, e))
+                continue
+            except openai.error.OpenAIError as e:
+                self.profiler.count("failed_samples")
+                return None, e
+            self.profiler.observe("request_seconds", time.perf_counter() - start)
+            if "usage" in completion:
+                self.profiler.count("prompt_tokens", completion["usage"]["prompt_tokens"])
+                self.profiler.count("completion_tokens", completion["usage"]["completion_tokens"])
+                if token_limiter is not None:
+                    token_limiter.adjust(completion["usage"]["total_tokens"] - estimate)
+            text = completion.choices[0].message["content"]
+            if key is not None:
+                self.cache.put(key, text)
+            return text, None
+        self.profiler.count("failed_samples")
+        return None, error
+
+    async def _run(self, prompts, progress, callback=None):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        limits = self.limits if self.limits is not None else rate_limits(self.requests_per_minute, self.tokens_per_minute)
+        results = [None] * len(prompts)
+
+        async def worker(index, prompt):
+            async with semaphore:
+                start = time.perf_counter()
+                results[index] = await self.complete(prompt, limits)
+                # end to end, including retries and backoff
+                seconds = time.perf_counter() - start
+                self.profiler.observe("sample_seconds", seconds)
+            if callback is not None:
+                callback(index, results[index], seconds)
+            progress.update(1)
+
+        await asyncio.gather(*(worker(i, p) for i, p in enumerate(prompts)))
+        return results
+
+    def run(self, prompts, desc="Requesting completions", callback=None):
+        """
+        Sends every prompt and returns a list of (text, error) aligned with `prompts`.
+        `callback(index, (text, error), seconds)` is called as soon as each prompt finishes,
+        with the prompt's end to end latency including retries.
+        """
+        with tqdm(total=len(prompts), desc=desc) as progress:
+            return asyncio.run(self._run(prompts, progress, callback))
@@ -0,0 +1,191 @@
+"""
+Local Hugging Face `transformers` backend.
+
+Generates rankings for many prompts per forward batch on a local causal LM.
+Prompts are sorted by length and cut into buckets so each batch carries little
+padding, and are left-padded so generation continues right after every prompt.
+Every prompt starts with the same system prefix, whose KV cache is computed once
+and expanded to the batch instead of being recomputed for each prompt.
+
+The returned list has the same shape as `ChatEngine.run`: one (text, error) per
+prompt, in the order of the prompts.
+
+`HFScorer` skips generation: it ranks the candidates by the log-likelihood of
+their titles after a history prompt. The history is run once, its KV cache is
+expanded to all candidates, and every title is scored in one batched forward
+pass, so each user costs a bounded amount of compute and never fails to parse.
+"""
+
+import time
+
+import numpy as np
+import torch
+from tqdm import tqdm
+from transformers import AutoConfig, AutoModelForCausalLM, AutoTokenizer, DynamicCache
+
+
+_MARKER = "\x00PROMPT\x00"
+
+
+def load_model(model, device="cpu", dtype="float32", random_init=False):
+    tokenizer = AutoTokenizer.from_pretrained(model)
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    torch_dtype = getattr(torch, dtype)
+    if random_init:
+        # Architecture and tokenizer from `model`, weights freshly initialized (for offline tests)
+        lm = AutoModelForCausalLM.from_config(AutoConfig.from_pretrained(model), torch_dtype=torch_dtype)
+    else:
+        lm = AutoModelForCausalLM.from_pretrained(model, torch_dtype=torch_dtype)
+    lm.to(device).eval()
+    return tokenizer, lm
+
+
+def split_chat_template(tokenizer, system):
+    """
+    Returns (prefix, suffix, add_special_tokens) so a prompt is rendered as prefix + prompt + suffix.
+    The prefix holds everything up to the user message and is the same for all prompts.
+    """
+    if tokenizer.chat_template:
+        for messages in (
+            [{"role": "system", "content": system}, {"role": "user", "content": _MARKER}],
+            # Some templates have no system role, fold it into the user turn instead
+            [{"role": "user", "content": f"{system}\n\n{_MARKER}"}],
+        ):
+            try:
+                text = tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+            except Exception:
+                continue
+            prefix, suffix = text.split(_MARKER)
+            return prefix, suffix, False
+    return f"{system}\n\n", "\nAnswer: ", True
+
+
+def expand_cache(cache, batch_size):
+    # Legacy tuple layout works with every model's generate()
+    if isinstance(cache, DynamicCache):
+        cache = cache.to_legacy_cache()
+    return tuple(tuple(t.expand(batch_size, *t.shape[1:]) for t in layer) for layer in cache)
+
+
+class HFGenerator:
+    def __init__(self, system, model, batch_size=8, max_new_tokens=48, device="cpu", dtype="float32",
+                 random_init=False, num_threads=None, reuse_prefix=True):
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        self.tokenizer, self.model = load_model(model, device, dtype, random_init)
+        self.device = device
+        self.batch_size = batch_size
+        self.max_new_tokens = max_new_tokens
+        self.reuse_prefix = reuse_prefix
+
+        prefix, self.suffix, add_special_tokens = split_chat_template(self.tokenizer, system)
+        self.prefix_ids = self.tokenizer(prefix, add_special_tokens=add_special_tokens, return_tensors="pt")["input_ids"].to(device)
+        self.prefix_cache = None
+        if reuse_prefix:
+            with torch.no_grad():
+                self.prefix_cache = self.model(input_ids=self.prefix_ids, use_cache=True).past_key_values
+
+    def encode(self, prompts):
+        return self.tokenizer([p + self.suffix for p in prompts], add_special_tokens=False)["input_ids"]
+
+    def batch_inputs(self, suffix_ids):
+        """Left-pads the per-prompt tokens and puts the shared prefix in front of the padding."""
+        width = max(len(ids) for ids in suffix_ids)
+        pad = self.tokenizer.pad_token_id
+        input_ids = torch.full((len(suffix_ids), width), pad, dtype=torch.long)
+        attention_mask = torch.zeros((len(suffix_ids), width), dtype=torch.long)
+        for row, ids in enumerate(suffix_ids):
+            input_ids[row, width - len(ids):] = torch.tensor(ids, dtype=torch.long)
+            attention_mask[row, width - len(ids):] = 1
+        prefix = self.prefix_ids.cpu().expand(len(suffix_ids), -1)
+        input_ids = torch.cat([prefix, input_ids], dim=1).to(self.device)
+        attention_mask = torch.cat([torch.ones_like(prefix), attention_mask], dim=1).to(self.device)
+        return input_ids, attention_mask
+
+    @torch.no_grad()
+    def generate(self, suffix_ids):
+        input_ids, attention_mask = self.batch_inputs(suffix_ids)
+        kwargs = {}
+        if self.prefix_cache is not None:
+            # generate() only runs the tokens after the cached prefix
+            kwargs["past_key_values"] = expand_cache(self.prefix_cache, len(suffix_ids))
+        output = self.model.generate(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            max_new_tokens=self.max_new_tokens,
+            do_sample=False,
+            pad_token_id=self.tokenizer.pad_token_id,
+            **kwargs,
+        )
+        return self.tokenizer.batch_decode(output[:, input_ids.shape[1]:], skip_special_tokens=True)
+
+    def buckets(self, suffix_ids):
+        # Similar lengths in the same batch keep padding small
+        order = np.argsort([len(ids) for ids in suffix_ids], kind="stable")
+        for start in range(0, len(order), self.batch_size):
+            yield order[start:start + self.batch_size]
+
+    def run(self, prompts, desc="Generating rankings", callback=None):
+        """
+        Generates every prompt and returns a list of (text, error) aligned with `prompts`.
+        `callback(index, (text, error), seconds)` is called as soon as each prompt finishes,
+        with the generation time of its batch.
+        """
+        suffix_ids = self.encode(prompts)
+        results = [None] * len(prompts)
+        with tqdm(total=len(prompts), desc=desc) as progress:
+            for bucket in self.buckets(suffix_ids):
+                start = time.perf_counter()
+                try:
+                    texts = self.generate([suffix_ids[i] for i in bucket])
+                    for i, text in zip(bucket, texts):
+                        results[i] = (text.strip(), None)
+                except RuntimeError as e:
+                    for i in bucket:
+                        results[i] = (None, e)
+                seconds = time.perf_counter() - start
+                if callback is not None:
+                    for i in bucket:
+                        callback(int(i), results[i], seconds)
+                progress.update(len(bucket))
+        return results
+
+
+class HFScorer:
+    def __init__(self, model, device="cpu", dtype="float32", random_init=False, num_threads=None, length_norm=True):
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        self.tokenizer, self.model = load_model(model, device, dtype, random_init)
+        self.device = device
+        # Mean instead of summed token log-probs, so long titles are not penalized
+        self.length_norm = length_norm
+
+    @torch.no_grad()
+    def score(self, context, titles):
+        """Log-likelihood of every title following `context`, one forward pass for all titles."""
+        context_ids = self.tokenizer(context, return_tensors="pt")["input_ids"].to(self.device)
+        title_ids = self.tokenizer([" " + t for t in titles], add_special_tokens=False)["input_ids"]
+        lengths = torch.tensor([len(ids) for ids in title_ids])
+
+        # Right padding is safe without a mask: causal attention never looks at later positions
+        input_ids = torch.full((len(titles), int(lengths.max())), self.tokenizer.pad_token_id, dtype=torch.long)
+        for row, ids in enumerate(title_ids):
+            input_ids[row, :len(ids)] = torch.tensor(ids, dtype=torch.long)
+        input_ids = input_ids.to(self.device)
+
+        prefix = self.model(input_ids=context_ids, use_cache=True)
+        output = self.model(input_ids=input_ids, past_key_values=expand_cache(prefix.past_key_values, len(titles)))
+
+        # The first title token is predicted by the last context position, the rest by the titles themselves
+        logits = torch.cat([prefix.logits[:, -1:].expand(len(titles), -1, -1), output.logits[:, :-1]], dim=1)
+        token_scores = torch.log_softmax(logits.float(), dim=-1).gather(-1, input_ids.unsqueeze(-1)).squeeze(-1)
+        mask = torch.arange(input_ids.shape[1])[None, :] < lengths[:, None]
+        scores = (token_scores.cpu() * mask).sum(1)
+        if self.length_norm:
+            scores = scores / lengths
+        return scores.numpy()
+
+    def run(self, contexts, titles, desc="Scoring candidates"):
+        """Scores a (users x candidates) matrix of titles, one history context per user."""
+        return np.stack([self.score(context, row) for context, row in tqdm(zip(contexts, titles), total=len(contexts), desc=desc)])
@@ -0,0 +1,88 @@
+"""
+Packing several users' ranking tasks into one chat request.
+
+K prompts are joined into one user message under "### User <n>" headers, and
+the model is asked to answer with one "User <n>: <ranking>" line per section.
+Every section of the answer is checked on its own; users whose line is missing
+or does not parse as a full ranking are sent again as ordinary single-user
+requests. With K users per request the number of requests, and the number of
+times the system prompt is sent, drops about K-fold.
+
+Packed requests are sent with the template's `packed_system` prompt, which asks
+for the per-user answer lines; the single-user system prompt asks for nothing
+but the movie numbers and would contradict them. Retries use the engine's own.
+"""
+
+import copy
+import re
+
+from llm.parsing import parse_ranking
+
+
+HEADER = "### User {}"
+INSTRUCTION = ("The following {count} sections are independent ranking tasks for {count} different users. "
+               "Solve each of them separately and answer with exactly one line per user in the form "
+               "\"User <number>: <ranking>\", for example \"User 1: 2,5,8,1,10\".")
+ANSWER = re.compile(r"^\W*user\s*(\d+)\W*?[:\-]\s*(.+?)\s*$", re.IGNORECASE | re.MULTILINE)
+
+
+def pack(prompts):
+    sections = [f"{HEADER.format(n)}\n{prompt}" for n, prompt in enumerate(prompts, 1)]
+    return "\n\n".join([INSTRUCTION.format(count=len(prompts))] + sections)
+
+
+def unpack(text, count):
+    """Splits a packed answer into one answer (or None when missing) per user."""
+    answers = [None] * count
+    for number, answer in ANSWER.findall(text or ""):
+        n = int(number)
+        if 1 <= n <= count and answers[n - 1] is None:
+            answers[n - 1] = answer
+    return answers
+
+
+def run_packed(engine, prompts, users_per_request, num_candidates, callback=None, system=None):
+    """
+    Same contract as `ChatEngine.run`: returns (text, error) per prompt and calls
+    `callback(index, (text, error), seconds)` as soon as a prompt's answer is final,
+    with the latency of the request that answered it. `system` is the system prompt
+    of the packed requests, by default the engine's.
+    """
+    results = [None] * len(prompts)
+    groups = [list(range(start, min(start + users_per_request, len(prompts))))
+              for start in range(0, len(prompts), users_per_request)]
+
+    def on_packed(j, result, seconds):
+        text, failure = result
+        if failure is not None:
+            return
+        for i, answer in zip(groups[j], unpack(text, len(groups[j]))):
+            if answer is None:
+                continue
+            try:
+                parse_ranking(answer, num_candidates)
+            except ValueError:
+                continue
+            results[i] = (answer, None)
+            if callback is not None:
+                callback(i, results[i], seconds)
+
+    # same cache, profiler and limits, only the system prompt differs
+    packed = engine
+    if system is not None:
+        packed = copy.copy(engine)
+        packed.system = system
+    packed.run([pack([prompts[i] for i in group]) for group in groups], desc="Requesting packed completions", callback=on_packed)
+
+    # Users whose section failed to parse, or whose packed request failed, are asked alone
+    retry = [i for i in range(len(prompts)) if results[i] is None]
+    engine.profiler.count("unpacked_retries", len(retry))
+
+    def on_single(j, result, seconds):
+        results[retry[j]] = result
+        if callback is not None:
+            callback(retry[j], result, seconds)
+
+    if retry:
+        engine.run([prompts[i] for i in retry], desc="Retrying unpacked users", callback=on_single)
+    return results
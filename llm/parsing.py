@@ -0,0 +1,13 @@
+def parse_ranking(text, num_candidates=11):
+    """
+    Parses a generated answer like "2,5,8,1,10,..." into 1-based candidate numbers.
+    Raises ValueError when the answer is not a complete ranking of the candidates.
+    """
+    ranking = [int(s.strip()) for s in text.split(',')]
+    if len(ranking) != num_candidates:
+        raise ValueError(f'Expected {num_candidates} candidates, got {len(ranking)}')
+    if any(i < 1 or i > num_candidates for i in ranking):
+        raise ValueError(f'Candidate number out of range 1-{num_candidates}')
+    if len(set(ranking)) != num_candidates:
+        raise ValueError(f'Repeated candidate numbers, expected each of 1-{num_candidates} once')
+    return ranking
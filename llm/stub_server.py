@@ -0,0 +1,139 @@
+"""
+Minimal OpenAI compatible chat completion server for local testing.
+
+It answers POST /v1/chat/completions with a deterministic permutation of the
+candidate numbers, optionally after a fixed latency and with a fraction of
+requests failing with HTTP 429, so the request engine can be exercised offline:
+
+    python -m llm.stub_server --port 8000 --latency 0.2 --failure_rate 0.1
+    python main.py engine.api_base=http://127.0.0.1:8000/v1
+
+Packed multi-user prompts (see llm/packing.py) get one "User <n>: ..." line per
+section, each section answered as if it had been sent alone. `drop_rate` leaves
+that fraction of sections unanswered to exercise the single-user retries.
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def count_candidates(prompt):
+    # Candidates are rendered as "1. Title", "2. Title", ...
+    numbers = [int(n) for n in re.findall(r"^(\d+)\. ", prompt, flags=re.MULTILINE)]
+    return max(numbers) if numbers else 11
+
+
+def fake_answer(prompt, drop_rate=0.0, rng=None):
+    sections = re.split(r"^### User (\d+)\n", prompt, flags=re.MULTILINE)
+    if len(sections) == 1:
+        return fake_ranking(prompt)
+    lines = []
+    for number, section in zip(sections[1::2], sections[2::2]):
+        if drop_rate and rng.random() < drop_rate:
+            continue
+        lines.append(f"User {number}: {fake_ranking(section.rstrip())}")
+    return "\n".join(lines)
+
+
+def fake_ranking(prompt):
+    # Seeded by the prompt so repeated requests get the same answer.
+    seed = int(hashlib.md5(prompt.encode("utf-8")).hexdigest()[:8], 16)
+    ranking = list(range(1, count_candidates(prompt) + 1))
+    random.Random(seed).shuffle(ranking)
+    return ",".join(str(i) for i in ranking)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    failure_rate = 0.0
+    drop_rate = 0.0
+    rng = random.Random(0)
+    lock = threading.Lock()
+    requests = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, headers=None):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        with StubHandler.lock:
+            StubHandler.requests += 1
+            fail = self.rng.random() < self.failure_rate
+        if self.latency:
+            time.sleep(self.latency)
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+            return
+        if fail:
+            self._send(429, {"error": {"message": "Rate limit reached", "type": "rate_limit_error"}}, {"Retry-After": "0"})
+            return
+
+        prompt = body["messages"][-1]["content"]
+        with StubHandler.lock:
+            content = fake_answer(prompt, self.drop_rate, self.rng)
+        prompt_tokens = sum(len(m["content"]) // 4 + 1 for m in body["messages"])
+        completion_tokens = len(content) // 4 + 1
+        self._send(200, {
+            "id": f"chatcmpl-stub-{StubHandler.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        })
+
+
+def make_server(host="127.0.0.1", port=8000, latency=0.0, failure_rate=0.0, drop_rate=0.0):
+    handler = type("Handler", (StubHandler,), {"latency": latency, "failure_rate": failure_rate, "drop_rate": drop_rate})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def serve(host="127.0.0.1", port=8000, latency=0.0, failure_rate=0.0, drop_rate=0.0):
+    """Starts the stub server in a background thread and returns it."""
+    server = make_server(host, port, latency, failure_rate, drop_rate)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds to wait before answering")
+    parser.add_argument("--failure_rate", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--drop_rate", type=float, default=0.0, help="fraction of packed sections left unanswered")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.latency, args.failure_rate, args.drop_rate)
+    print(f"Serving stub chat completions on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,49 @@
+"""
+Builds a tiny randomly initialized GPT-2 with a byte-level BPE tokenizer, so the
+`hf` method can be run and tested fully offline on CPU:
+
+    python -m llm.tiny_model ./models/tiny
+    python main.py method=hf hf.model=./models/tiny
+"""
+
+import argparse
+import glob
+import os
+
+import torch
+from tokenizers import ByteLevelBPETokenizer
+from transformers import GPT2Config, GPT2LMHeadModel, PreTrainedTokenizerFast
+
+
+def build(path, vocab_size=1024, n_layer=2, n_head=2, n_embd=64, n_positions=2048, seed=0):
+    # Byte-level BPE can encode any text, the templates only shape the merges
+    corpus = []
+    for fname in glob.glob(os.path.join(os.path.dirname(__file__), "..", "config", "template", "*.yaml")):
+        with open(fname) as f:
+            corpus.append(f.read())
+    corpus.append(",".join(str(i) for i in range(1, 101)))
+
+    bpe = ByteLevelBPETokenizer()
+    bpe.train_from_iterator(corpus, vocab_size=vocab_size, special_tokens=["<|endoftext|>"])
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=bpe._tokenizer, eos_token="<|endoftext|>",
+                                        bos_token="<|endoftext|>", pad_token="<|endoftext|>")
+
+    torch.manual_seed(seed)
+    config = GPT2Config(vocab_size=len(tokenizer), n_positions=n_positions, n_layer=n_layer, n_head=n_head,
+                        n_embd=n_embd, bos_token_id=tokenizer.eos_token_id, eos_token_id=tokenizer.eos_token_id)
+    model = GPT2LMHeadModel(config)
+
+    tokenizer.save_pretrained(path)
+    model.save_pretrained(path)
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path")
+    parser.add_argument("--vocab_size", type=int, default=1024)
+    parser.add_argument("--n_layer", type=int, default=2)
+    parser.add_argument("--n_embd", type=int, default=64)
+    args = parser.parse_args()
+    build(args.path, vocab_size=args.vocab_size, n_layer=args.n_layer, n_embd=args.n_embd)
+    print(f"Saved tiny model to {args.path}")
@@ -1,138 +1,438 @@
-import random
-from datasets import load_dataset
-import evaluate
 import hydra
 from omegaconf import DictConfig, OmegaConf
 import numpy as np
-import openai
 import os
+import json
 import logging
+import threading
 from hydra.utils import get_original_cwd, to_absolute_path
-from tqdm import tqdm
-from time import sleep
+
+from baseline.ranking import popularity_ranking, random_ranking, score_ranking, target_ranks
+from llm.parsing import parse_ranking
+from metric.ranking import summarize
+from metric.stream import StreamingNDCG
+from utils import artifacts
+from utils.journal import Journal
+from utils.pipeline import Pipeline, Stage
+from utils.profiling import Profiler, profiled
+from utils.results import ResultWriter
+from utils.prompt import PromptTemplate, render_batch
+from utils.shards import shard_indices, shard_path, write_shard
+from utils.vocab import ItemTable
 
 
 log = logging.getLogger(__name__)
 
-@hydra.main(version_base=None, config_path="config", config_name="config")
-def main(config: DictConfig) -> None:
+# methods whose generated text is parsed into a ranking
+LLM_METHODS = ('openai', 'hf')
+# methods that score every item, and so can rank against the full catalog
+CATALOG_METHODS = ('popularity', 'random', 'knn')
+
 
-    openai.api_key = os.getenv("OPENAI_API_KEY")
+# `datasets`, `openai` and `torch` are imported where they are needed, so a run only pays for what it uses
 
-    fname = os.path.join(get_original_cwd(), config['output_dir'], 'log.txt')
-    wfile = open(fname, 'w')
+def artifact_dir(config):
+    return to_absolute_path(config['artifacts']['path']) if config['artifacts']['path'] else None
+
+
+def load_items(config):
+    cache_dir = artifact_dir(config)
+    if cache_dir and os.path.exists(artifacts.item_path(cache_dir)):
+        return ItemTable.load(artifacts.item_path(cache_dir))
 
     # data loader for ml100k
+    from datasets import load_dataset
     item = load_dataset('datasets/ml100k.py', 'item', split='data')
     data = load_dataset('datasets/ml100k.py', 'data', split='data')
 
-    # create iid to title dict
-    iid_dict = {i['iid']: i['title'] for i in item}
-    # create iid to popularity dict
-    iid_pop_dict = {i['iid']: 0 for i in item}
-    for d in data:
-        iid_pop_dict[d['iid']] += 1
+    # dense item codes with titles, genres and popularity as arrays indexed by code
+    items = ItemTable(item, data)
+    if cache_dir:
+        artifacts.save_items(artifacts.item_path(cache_dir), items)
+    return items
+
+
+def load_interactions(config, items):
+    """uid, item code and timestamp of every rating, for methods that learn from the interactions."""
+    cache_dir = artifact_dir(config)
+    if cache_dir and os.path.exists(artifacts.interaction_path(cache_dir)):
+        return artifacts.load_interactions(artifacts.interaction_path(cache_dir))
+
+    from datasets import load_dataset
+    from utils.vocab import int_column
+    data = load_dataset('datasets/ml100k.py', 'data', split='data')
+    interactions = (int_column(data, 'uid'), items.vocab.encode(int_column(data, 'iid')), int_column(data, 'timestamp'))
+    if cache_dir:
+        artifacts.save_interactions(artifacts.interaction_path(cache_dir), *interactions)
+    return interactions
+
+
+def load_split(config):
+    # load ml100k seq dataset, the negatives depend on the sampling config only
+    sampling = OmegaConf.to_container(config['sampling'], resolve=True)
+    # windowed splits can run to millions of samples, they stay in the memory-mapped Arrow cache of `datasets`
+    cache_dir = artifact_dir(config) if sampling['window_stride'] is None else None
+    if cache_dir and os.path.exists(artifacts.split_path(cache_dir, 'test', sampling)):
+        return artifacts.load_split(artifacts.split_path(cache_dir, 'test', sampling))
+
+    from datasets import load_dataset
+    seq = load_dataset('datasets/ml100k_seq.py', '100k', split='test', **sampling)
+    if cache_dir:
+        artifacts.save_split(artifacts.split_path(cache_dir, 'test', sampling), seq)
+    return seq
+
 
-    # load ml100k seq dataset
-    seq = load_dataset('datasets/ml100k_seq.py', split='test')
+def rank_catalog(config, items, samples, sample_indices, train_users, train_items, similarity, output_dir):
+    """Ranks every target against all items its user has not rated, writes the top k items and returns the ranks."""
+    from baseline.catalog import catalog_ranks, seen_matrix
+    num_items = len(items)
+    # windows only mask what their user rated before the target
+    lengths = samples['position'] if 'position' in samples.column_names else None
+    seen = seen_matrix(train_users, train_items, samples['uid'], num_items, lengths)
 
-    random.seed(config['seed'])
+    if config['method'] == 'popularity':
+        def score_block(start, stop):
+            return np.broadcast_to(items.popularity, (stop - start, num_items)), None
+    elif config['method'] == 'knn':
+        from baseline.knn import history_matrix
+        history = history_matrix(samples['seq'], num_items)
+
+        # items without co-occurrences are ordered by popularity, as with sampled candidates
+        def score_block(start, stop):
+            return (history[start:stop] @ similarity).toarray(), np.broadcast_to(items.popularity, (stop - start, num_items))
+    else:
+        rng = np.random.default_rng(config['seed'])
+
+        def score_block(start, stop):
+            return rng.random((stop - start, num_items)), None
+
+    cutoffs = [k for k in config['metric']['k'] if k is not None]
+    top_k = max(cutoffs) if cutoffs else 10
+    rank_array, top = catalog_ranks(score_block, seen, samples['target'], num_items, top_k, config['ranking']['block_mb'])
+    np.savez(os.path.join(output_dir, f'top{top_k}-{config["shard_id"]:05d}-of-{config["num_shards"]:05d}.npz'),
+             index=sample_indices, uid=np.asarray(samples['uid']), iid=items.vocab.decode(top))
+    return dict(enumerate(rank_array.tolist()))
+
+
+def evaluate(config, items, seq, output_dir, profiler=None, limits=None):
+    """
+    Runs config['method'] on the test split, writes its outputs to output_dir and returns the metric summary.
+    `limits` are rate limiters shared with other runs of the process, see llm.engine.rate_limits.
+    """
+    # stage timings, request latencies and token counts, written to report-*.json and metrics-*.prom
+    profiler = profiler if profiler is not None else Profiler()
+    full_catalog = config['ranking']['candidates'] == 'full'
+    if full_catalog and config['method'] not in CATALOG_METHODS:
+        raise ValueError(f'ranking.candidates=full needs a method that scores every item, one of {CATALOG_METHODS}')
+    if config['method'] == 'knn' and config['sampling']['window_stride'] is not None:
+        # the co-occurrences leave out only every user's last item, earlier windows' targets would score themselves
+        raise ValueError('method=knn learns from every interaction but the last, it cannot be used with sampling.window_stride')
+    os.makedirs(output_dir, exist_ok=True)
+    # one structured record per sample, written in batches by a background thread
+    results = ResultWriter(output_dir, config['shard_id'], config['num_shards'], **config['results'])
+    titles = items.titles
+    num_candidates = config['sampling']['num_negatives'] + 1
+
+    num_samples = len(seq)
+    if config['max_test_samples'] is not None:
+        num_samples = min(num_samples, config['max_test_samples'])
+    # this shard's positions in the test split, every sample when num_shards is 1
+    sample_indices = shard_indices(num_samples, config['shard_id'], config['num_shards'])
 
     # Preprocessing the datasets
-    def preprocess_function(examples):
-        # Tokenize the texts
-        candidates_and_answer = examples['candidates'] + [examples['target']]
-        random.shuffle(candidates_and_answer)
-        examples["candidates_and_answer"] = candidates_and_answer
-        examples["can_input"] = '\n'.join([f'{i+1}. {iid_dict[iid]}' for i, iid in enumerate(candidates_and_answer)])
-        examples["input"] = '\n'.join([f'{iid_dict[iid]}' for iid in examples['seq']])
-        # examples["input"] = '; '.join([iid_dict[iid] for iid in examples['seq']])
-        examples["answer"] = iid_dict[examples['target']]
-        return examples
-
-    processed_datasets = seq.map(
-        preprocess_function,
-        # remove_columns=seq.column_names,
-        desc="To Natural language and Applying prompts",
-    )
-
-    ndcg = evaluate.load('metric/ndcg.py', experiment_id='ndcg')
+    # Batched and optionally multi-process, candidate order is derived from (seed, uid),
+    # only the evaluated samples are rendered, windowed splits can be far larger
+    with profiler.stage('render'):
+        samples = seq.select(sample_indices).map(
+            render_batch,
+            batched=True,
+            batch_size=config['preprocessing']['batch_size'],
+            num_proc=config['preprocessing']['num_proc'],
+            fn_kwargs={
+                'vocab': items.vocab,
+                'titles': titles,
+                'prompt': config['template']['prompt'],
+                'seed': config['seed'],
+            },
+            desc="To Natural language and Applying prompts",
+        )
+
+    # running nDCG sums per cutoff, fed with the target's rank of every sample
+    ndcg = StreamingNDCG(k=config['metric']['k'])
+
+    num_samples = len(samples)
+    prompts = samples['prompt']
+
+    system = PromptTemplate(config['template']['system']).render(NUM_CANDIDATES=num_candidates)
 
     error = {}
-    for cnt, d in tqdm(enumerate(processed_datasets)):
-        if cnt == config['max_test_samples']:
-            break
-        prompt = config['template']['prompt']
-        prompt = prompt.replace("[SEQ]", d['input'])
-        prompt = prompt.replace("[CANDIDATES]", d['can_input'])
-    
-        print(cnt, prompt, file=wfile)
-
-        ### openai chatGPT ###
-        if config['method'] == 'openai':
-            # Try 4 times for successful request
-            error_flag = False
-            for x in range(0, 4):  
-                try:
-                    completion = openai.ChatCompletion.create(
-                        model="gpt-3.5-turbo-0301",
-                        messages=[
-                            {"role": "system", "content": config['template']['system']},
-                            {"role": "user", "content": prompt},
-                        ],
-                        temperature=0
-                    )
-                    break
-                except:
-                    error_flag = True
-                    sleep(2)
-                    
-            if error_flag:
-                error[cnt] = "Max retries exceeded with url"
-                continue
+    outputs = {}
+    # sample index -> 1-based rank of the target, kept for CIs and paired comparisons
+    ranks = {}
+
+    # adaptive mode evaluates the samples in a random order and stops requesting once the stopper is done, see metric/adaptive.py
+    adaptive = config['adaptive']
+    stopper = None
+    if adaptive['enabled'] and config['method'] not in LLM_METHODS:
+        log.warning(f'adaptive.enabled only applies to {LLM_METHODS}, {config["method"]} ranks every sample at once')
+    elif adaptive['enabled']:
+        from metric.adaptive import EarlyStopping, load_baseline
+        stopper = EarlyStopping(adaptive['metrics'], config['metric']['k'], adaptive['tolerance'], config['metric']['alpha'],
+                                adaptive['min_samples'], adaptive['check_every'], num_samples,
+                                load_baseline(to_absolute_path(adaptive['baseline'])) if adaptive['baseline'] else None)
+
+    ### LLM methods, run as dispatch -> parse -> score -> log on their own threads, see utils/pipeline.py ###
+    if config['method'] in LLM_METHODS:
+        responses = [None] * num_samples
+        uids, permutations, targets = samples['uid'], samples['candidates_and_answer'], samples['target']
+        # completions journaled by an earlier attempt with this output_dir are reused, only the rest is requested
+        journal = None
+        if config['journal']['enabled']:
+            journal = Journal(os.path.join(output_dir, f'journal-{config["shard_id"]:05d}-of-{config["num_shards"]:05d}.jsonl'),
+                              config['journal']['sync_every'])
+            for cnt, (uid, permutation) in enumerate(zip(uids, permutations)):
+                record = journal.get(int(sample_indices[cnt]))
+                if record is None:
+                    continue
+                if record['uid'] != uid or record['permutation'] != permutation:
+                    raise ValueError(f'{journal.path} was written with different samples, use a new output_dir')
+                responses[cnt] = (record['response'], None)
+            if len(journal):
+                log.info(f'Resuming from {journal.path}, {sum(r is not None for r in responses)} samples already done')
+        order = range(num_samples) if stopper is None else np.random.default_rng(config['seed']).permutation(num_samples).tolist()
+        pending = [cnt for cnt in order if responses[cnt] is None]
+        # adaptive runs request check_every samples at a time and stop between chunks
+        step = len(pending) if stopper is None else adaptive['check_every']
+        chunks = [pending[start:start + step] for start in range(0, len(pending), max(step, 1))]
+        # results through the score stage, the next chunk is only requested once the stopper has seen the last one
+        scored = [0]
+        progress = threading.Condition()
 
+        def source(emit):
+            # journaled samples go straight to parsing, results of the rest are emitted as they arrive
+            for cnt in order:
+                if responses[cnt] is not None:
+                    emit((cnt, responses[cnt], False, None))
+
+            ### openai chatGPT ###
+            if config['method'] == 'openai':
+                import openai
+                from llm.cache import ResponseCache
+                from llm.engine import ChatEngine
+                from llm.packing import run_packed
+                openai.api_key = os.getenv("OPENAI_API_KEY")
+                # Requests run concurrently, on_result passes every response on as it arrives
+                cache_path = to_absolute_path(config['cache']['path']) if config['cache']['path'] else None
+                cache = ResponseCache(cache_path, config['cache']['mode'] if cache_path else 'off', config['cache']['max_size_mb'])
+                engine = ChatEngine(system=system, cache=cache, profiler=profiler, limits=limits, **config['engine'])
+                if config['packing']['users_per_request'] > 1:
+                    # packed requests ask for one answer line per user, see llm/packing.py
+                    packed_system = PromptTemplate(config['template']['packed_system']).render(NUM_CANDIDATES=num_candidates)
+                    run = lambda chunk, callback: run_packed(engine, chunk, config['packing']['users_per_request'], num_candidates,
+                                                             callback=callback, system=packed_system)
+                else:
+                    run = lambda chunk, callback: engine.run(chunk, callback=callback)
+
+            ### local transformers model ###
+            elif config['method'] == 'hf':
+                # imported here so other methods do not pay for loading torch
+                from llm.hf import HFGenerator
+                generator = HFGenerator(system=system, **config['hf'])
+                run = lambda chunk, callback: generator.run(chunk, callback=callback)
+
+            emitted = num_samples - len(pending)
+            for chunk in chunks:
+                if stopper is not None:
+                    with progress:
+                        progress.wait_for(lambda: scored[0] >= emitted or pipeline.error is not None)
+                    if stopper.check():
+                        break
+                emitted += len(chunk)
+                run([prompts[cnt] for cnt in chunk], lambda i, result, seconds, chunk=chunk: emit((chunk[i], result, True, seconds)))
+
+            if config['method'] == 'openai':
+                if cache.enabled:
+                    log.info(f'Response cache: {cache.hits} hits, {cache.misses} misses, {len(cache)} entries')
+                cache.close()
+
+        def parse(item):
+            cnt, (text_results, failure), fresh, seconds = item
             # Check for invalid generation
+            split_results = None
+            if failure is None:
+                try:
+                    split_results = parse_ranking(text_results, num_candidates)
+                except ValueError as e:
+                    failure = e
+            return [cnt, text_results, failure, split_results, fresh, seconds, None]
+
+        def score(item):
+            # the only stage touching the metric state, so it runs on one thread
+            cnt, text_results, failure, split_results = item[:4]
             try:
-                text_results = completion.choices[0].message["content"]
-                print(text_results, file=wfile)
-                print(file=wfile)
-                split_results = text_results.split(',')
-                split_results = [int(s.strip()) for s in split_results]
-                if len(split_results) != 11:
+                if text_results is None:
+                    error[cnt] = f"Request failed ({type(failure).__name__}: {failure})"
+                    return item
+                outputs[cnt] = text_results
+                if split_results is None:
                     error[cnt] = text_results
-                    continue
-            except:
-                error[cnt] = text_results
-                continue
-            
-            ordered_list = [d['candidates_and_answer'][i-1] for i in split_results]
-
-        ### popularity baseline ###
-        elif config['method'] == 'popularity':
-            candidate_pop_dict = {j: iid_pop_dict[j] for j in d['candidates_and_answer']}
-            sorted_candidate_pop_dict = sorted(candidate_pop_dict.items(), key=lambda x: x[1], reverse=True)
-            ordered_list = [j[0] for j in sorted_candidate_pop_dict]
-        ### random baseline ###
-        else:
-            ordered_list = d['candidates_and_answer']
-            random.shuffle(ordered_list)
+                    profiler.count('parse_errors')
+                    return item
+                ordered_list = [permutations[cnt][i-1] for i in split_results]
+                rank = ordered_list.index(targets[cnt]) + 1 if targets[cnt] in ordered_list else 0
+                ndcg.add(rank)
+                ranks[cnt] = rank
+                if stopper is not None:
+                    stopper.add(int(sample_indices[cnt]), rank)
+                item[6] = rank
+                return item
+            finally:
+                with progress:
+                    scored[0] += 1
+                    progress.notify_all()
+
+        def write(item):
+            # records are written in completion order, load_results sorts them by index
+            cnt, text_results, failure, split_results, fresh, seconds, rank = item
+            results.write(sample_indices[cnt], uids[cnt], prompts[cnt], text_results, split_results, rank, seconds, failure)
+            # failed requests are not journaled and are retried on resume
+            if journal is not None and fresh and text_results is not None:
+                journal.append({'index': int(sample_indices[cnt]), 'uid': uids[cnt], 'permutation': permutations[cnt],
+                                'response': text_results, 'ranking': split_results})
+
+        def wake(error):
+            # a failed stage stops counting scored results, the source must not wait for them
+            with progress:
+                progress.notify_all()
+
+        pipeline = Pipeline([Stage('parse', parse, config['pipeline']['parse_workers']), Stage('score', score), Stage('log', write)],
+                            config['pipeline']['queue_size'], profiler, on_error=wake)
+        with profiler.stage('dispatch'):
+            try:
+                pipeline.run(source)
+            finally:
+                if journal is not None:
+                    journal.close()
 
-        prediction = [1 if j == d['target'] else 0 for j in ordered_list]
-        ndcg.add(prediction=prediction)
+    ### local transformers model, likelihood of every candidate title ###
+    elif config['method'] == 'hf_score':
+        with profiler.stage('dispatch'):
+            from llm.hf import HFScorer
+            hf = config['hf']
+            scorer = HFScorer(hf['model'], hf['device'], hf['dtype'], hf['random_init'], hf['num_threads'], **config['hf_score'])
+            score_prompt = PromptTemplate(config['template']['score_prompt'])
+            contexts = [score_prompt.render(SEQ=seq_input, NUM_CANDIDATES=num_candidates) for seq_input in samples['input']]
+            scores = scorer.run(contexts, titles[np.asarray(samples['candidates_and_answer'])])
 
+    # every interaction but the test targets, learned from by knn and masked out of full catalog rankings
+    if config['method'] == 'knn' or full_catalog:
+        from baseline.knn import training_interactions
+        with profiler.stage('interactions'):
+            train_users, train_items = training_interactions(*load_interactions(config, items))
 
-    # ndcg_results = ndcg.compute(k=[10, 20, 50, 100])
-    ndcg_results = ndcg.compute(k=10)
-    # ndcg_results = ndcg.compute()
+    ### item-kNN, similarity to the history from item co-occurrence in the other interactions ###
+    if config['method'] == 'knn':
+        from baseline.knn import item_similarity, knn_scores
+        with profiler.stage('similarity'):
+            similarity = item_similarity(train_users, train_items, len(items), **config['knn'])
+        if not full_catalog:
+            with profiler.stage('dispatch'):
+                scores = knn_scores(similarity, samples['seq'], samples['candidates_and_answer'])
 
-    log.info(f'NDCG results for {config["method"]} method')
-    for k, v in ndcg_results.items():
-        log.info(f'{k}: {v}')
+    ### scoring methods against every unrated item, see baseline/catalog.py ###
+    if config['method'] not in LLM_METHODS and full_catalog:
+        with profiler.stage('rank'):
+            ranks = rank_catalog(config, items, samples, sample_indices, train_users, train_items,
+                                 similarity if config['method'] == 'knn' else None, output_dir)
+            ndcg.add_batch(list(ranks.values()))
+            for cnt, (uid, prompt) in enumerate(zip(samples['uid'], prompts)):
+                results.write(sample_indices[cnt], uid, prompt, rank=ranks[cnt])
 
-    if len(error) > 0:
-        log.info('Error cases')
-        for k, v in error.items():
+    ### baselines and model scores rank the whole candidate matrix at once ###
+    elif config['method'] not in LLM_METHODS:
+        with profiler.stage('rank'):
+            candidates = np.asarray(samples['candidates_and_answer'])
+            targets = np.asarray(samples['target'])
+            if config['method'] == 'popularity':
+                ranked = popularity_ranking(candidates, items.popularity)
+            elif config['method'] == 'hf_score':
+                ranked = score_ranking(candidates, scores)
+            elif config['method'] == 'knn':
+                # candidates without co-occurrences are ordered by popularity
+                ranked = score_ranking(candidates, scores, items.popularity[candidates])
+            else:
+                ranked = random_ranking(candidates, config['seed'])
+            ranks = dict(enumerate(target_ranks(ranked, targets).tolist()))
+            ndcg.add_batch(list(ranks.values()))
+            for cnt, (uid, prompt) in enumerate(zip(samples['uid'], prompts)):
+                results.write(sample_indices[cnt], uid, prompt, rank=ranks[cnt])
+
+    # every sample ends up with a rank or an error, adaptive runs leave the rest unevaluated
+    profiler.count('samples', len(ranks) + len(error))
+
+    with profiler.stage('metrics'):
+        ndcg_results = ndcg.compute()
+
+        log.info(f'NDCG results for {config["method"]} method')
+        for k, v in ndcg_results.items():
             log.info(f'{k}: {v}')
 
+        indices = np.array(sorted(ranks), dtype=np.int64)
+        rank_array = np.array([ranks[i] for i in indices], dtype=np.int64)
+        uids = np.asarray(samples['uid'])[indices]
+        metric_config = config['metric']
+        # shard file with positions in the whole test split, merged by `python -m utils.shards`
+        write_shard(
+            shard_path(output_dir, config['shard_id'], config['num_shards']),
+            config['shard_id'], config['num_shards'], sample_indices[indices], uids, rank_array, ndcg,
+            {int(sample_indices[k]): v for k, v in outputs.items()}, {int(sample_indices[k]): v for k, v in error.items()},
+            {**OmegaConf.to_container(metric_config), 'seed': config['seed']},
+        )
+        if config['num_shards'] > 1:
+            log.info(f'Shard {config["shard_id"]} of {config["num_shards"]} done, merge with `python -m utils.shards {output_dir}`')
+        else:
+            np.savez(os.path.join(output_dir, 'ranks.npz'), index=indices, uid=uids, rank=rank_array)
+        summary = summarize(rank_array, metric_config['k'], metric_config['num_resamples'], metric_config['alpha'], config['seed'])
+        log.info(f'Ranking metrics with {1 - metric_config["alpha"]:.0%} bootstrap intervals over {len(rank_array)} samples')
+        for k, (mean, lower, upper) in summary.items():
+            log.info(f'{k}: {mean:.4f} [{lower:.4f}, {upper:.4f}]')
+
+        if stopper is not None:
+            report = stopper.report()
+            stop = f'stopped on {report["reason"]}' if stopper.stopped else 'ran out of samples before stopping'
+            log.info(f'Adaptive evaluation {stop}, {len(ranks) + len(error)} of {num_samples} samples used, '
+                     f'{len(ranks)} ranked, {1 - metric_config["alpha"]:.0%} normal intervals')
+            for k, (mean, lower, upper) in report['interval'].items():
+                log.info(f'{k}: {mean:.4f} [{lower:.4f}, {upper:.4f}] half-width {(upper - lower) / 2:.4f}')
+            for k, (diff, lower, upper, decision) in report.get('paired', {}).items():
+                log.info(f'{k} vs baseline: {diff:+.4f} [{lower:+.4f}, {upper:+.4f}] over {report["paired_samples"]} paired samples, '
+                         f'{decision or "undecided"}')
+            with open(os.path.join(output_dir, f'adaptive-{config["shard_id"]:05d}-of-{config["num_shards"]:05d}.json'), 'w') as f:
+                json.dump({**report, 'evaluated': len(ranks) + len(error), 'num_samples': num_samples}, f, indent=2)
+
+        if len(error) > 0:
+            log.info('Error cases')
+            for k, v in sorted(error.items()):
+                log.info(f'{k}: {v}')
+
+    with profiler.stage('write_results'):
+        results.close()
+    profiler.write(output_dir, labels={'method': config['method'], 'shard': config['shard_id']},
+                   shard_id=config['shard_id'], num_shards=config['num_shards'])
+    return summary
+
+
+@hydra.main(version_base=None, config_path="config", config_name="config")
+def main(config: DictConfig) -> None:
+
+    output_dir = os.path.join(get_original_cwd(), config['output_dir'])
+    profiler = Profiler()
+    with profiled(output_dir, config['profile']['cprofile'], shard_id=config['shard_id'], num_shards=config['num_shards']):
+        with profiler.stage('load_items'):
+            items = load_items(config)
+        with profiler.stage('load_split'):
+            seq = load_split(config)
+        evaluate(config, items, seq, output_dir, profiler)
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,125 @@
+"""
+Adaptive evaluation that stops once the metrics are known well enough.
+
+Samples are evaluated in a random order, so every prefix of the run is a
+random subset of the test split and its mean is an unbiased estimate of the
+full split's. The stopper keeps running sums of the per-sample scores of
+`metric.ranking.per_sample_scores`. At every `check`, which main makes after
+each chunk of `check_every` requested samples once `min_samples` are ranked, a
+normal confidence interval of every tracked metric is computed. The run stops
+when
+
+- every interval's half-width is at most `tolerance`, or
+- a saved baseline run is given and the paired difference to it is decided for
+  every tracked metric: its interval excludes 0 (better or worse), or lies
+  within +-tolerance (equivalent).
+
+The paired intervals are widened for the number of checks the run can make
+(Bonferroni over the checks), since looking at the difference again and again
+and stopping on the first decision would otherwise call too many differences.
+The final bootstrap summary of main is computed over the samples used as usual.
+"""
+
+import math
+from statistics import NormalDist
+
+import numpy as np
+
+from metric.ranking import per_sample_scores
+
+
+def load_baseline(path):
+    """Sample index -> rank of a saved run's ranks.npz."""
+    run = np.load(path)
+    return dict(zip(run["index"].tolist(), run["rank"].tolist()))
+
+
+class EarlyStopping:
+    def __init__(self, metrics=("nDCG@10",), k=(10,), tolerance=0.01, alpha=0.05, min_samples=100,
+                 check_every=100, max_samples=None, baseline=None):
+        """`baseline` maps a sample index to the target's rank in the run to compare against."""
+        names, _ = per_sample_scores([], k)
+        unknown = [m for m in metrics if m not in names]
+        if unknown:
+            raise ValueError(f"Unknown adaptive metrics {unknown}, expected some of {names} for k={list(k)}")
+        self.k = list(k)
+        self.metrics = list(metrics)
+        self.columns = [names.index(m) for m in metrics]
+        self.tolerance = tolerance
+        self.min_samples = min_samples
+        self.baseline = baseline
+        self.z = NormalDist().inv_cdf(1 - alpha / 2)
+        # at most one check per chunk of check_every samples
+        looks = 1 if max_samples is None else max(1, math.ceil(max_samples / check_every))
+        self.paired_z = NormalDist().inv_cdf(1 - alpha / (2 * looks))
+
+        self.count = self.paired_count = 0
+        self.sums = np.zeros(len(metrics))
+        self.squares = np.zeros(len(metrics))
+        self.paired_sums = np.zeros(len(metrics))
+        self.paired_squares = np.zeros(len(metrics))
+        self.stopped = False
+        self.reason = None
+
+    def _scores(self, rank):
+        return per_sample_scores([rank], self.k)[1][0, self.columns]
+
+    def add(self, index, rank):
+        """Adds one ranked sample, `index` is its position in the test split."""
+        scores = self._scores(rank)
+        self.count += 1
+        self.sums += scores
+        self.squares += scores ** 2
+        if self.baseline is not None and index in self.baseline:
+            diff = scores - self._scores(self.baseline[index])
+            self.paired_count += 1
+            self.paired_sums += diff
+            self.paired_squares += diff ** 2
+
+    @staticmethod
+    def _interval(count, sums, squares, z):
+        mean = sums / max(count, 1)
+        variance = np.maximum(squares - count * mean ** 2, 0) / max(count - 1, 1)
+        half = z * np.sqrt(variance / max(count, 1))
+        return mean, mean - half, mean + half
+
+    def interval(self):
+        """{metric: (mean, lower, upper)} of the samples so far."""
+        mean, lower, upper = self._interval(self.count, self.sums, self.squares, self.z)
+        return {m: (mean[i], lower[i], upper[i]) for i, m in enumerate(self.metrics)}
+
+    def paired(self):
+        """{metric: (difference, lower, upper, decision)} against the baseline, decision is None while undecided."""
+        diff, lower, upper = self._interval(self.paired_count, self.paired_sums, self.paired_squares, self.paired_z)
+        results = {}
+        for i, m in enumerate(self.metrics):
+            decision = None
+            if self.paired_count >= 2:
+                if lower[i] > 0:
+                    decision = "better"
+                elif upper[i] < 0:
+                    decision = "worse"
+                elif -self.tolerance <= lower[i] and upper[i] <= self.tolerance:
+                    decision = "equivalent"
+            results[m] = (diff[i], lower[i], upper[i], decision)
+        return results
+
+    def check(self):
+        """Decides whether to stop from the samples so far, returns self.stopped."""
+        if self.stopped or self.count < max(self.min_samples, 2):
+            return self.stopped
+        _, lower, upper = self._interval(self.count, self.sums, self.squares, self.z)
+        if np.all((upper - lower) / 2 <= self.tolerance):
+            self.stopped, self.reason = True, "tolerance"
+        elif self.baseline is not None and all(d is not None for *_, d in self.paired().values()):
+            self.stopped, self.reason = True, "baseline"
+        return self.stopped
+
+    def report(self):
+        report = {"samples": self.count, "stopped": self.stopped, "reason": self.reason, "tolerance": self.tolerance,
+                  "interval": {m: list(map(float, v)) for m, v in self.interval().items()}}
+        if self.baseline is not None:
+            report["paired_samples"] = self.paired_count
+            report["paired"] = {m: [float(d), float(lo), float(up), decision]
+                                for m, (d, lo, up, decision) in self.paired().items()}
+        return report
@@ -1,8 +1,12 @@
-import evaluate
-from sklearn.metrics import ndcg_score
-import datasets
 import numpy as np
 
+# `ndcg` below is plain NumPy, the evaluate wrapper is only defined where evaluate is installed
+try:
+    import datasets
+    import evaluate
+except ImportError:
+    evaluate = None
+
 _DESCRIPTION = """
 Compute Normalized Discounted Cumulative Gain.
 Sums the true scores ranked in the order induced by the predicted scores,
@@ -84,54 +88,42 @@ _CITATION = """
 }
 """
 
-class nDCG(evaluate.Metric):
-    def _info(self):
-        return evaluate.MetricInfo(
-            description=_DESCRIPTION,
-            citation=_CITATION,
-            inputs_description=_KWARGS_DESCRIPTION,
-            features=datasets.Features({
-                'predictions': datasets.Sequence(datasets.Value('float')),
-                'references': datasets.Sequence(datasets.Value('float'))
-            }),
-            reference_urls=["https://scikit-learn.org/stable/modules/generated/sklearn.metrics.ndcg_score.html"],
-        )
+def ndcg(predictions, k=None):
+    """
+    nDCG of binary relevance vectors given in ranked order, e.g. one-hot vectors marking the target.
+    `k` is a cutoff or list of cutoffs, None stands for no cutoff. Usable without `evaluate.load`.
+    """
+    results = {}
+    predictions = np.asarray(predictions, dtype=np.float64)
+    total_size = predictions.shape[1]
 
-    def _compute(self, predictions, references=None, sample_weight=None, k=None, ignore_ties=False):
-        results = {}
-        predictions = np.array(predictions)
-        # references = np.array(references)
-        total_size = predictions.shape[1]
+    answer_count = predictions.sum(1).astype(np.int64)
+    # weights[i] is the discount of position i+1, ideal_dcg[n] the DCG of n hits on top
+    weights = 1 / np.log2(np.arange(1, total_size + 1) + 1)
+    ideal_dcg = np.concatenate([[0.0], np.cumsum(weights)])
 
-        answer_count = predictions.sum(1).astype(np.int64)
-        
-        if hasattr(k, "__iter__"):
-            for i in k:
-                positions = np.arange(1, i + 1)
-                weights = 1 / np.log2(positions + 1)
-                hit_per_pos = predictions[:,:i]
-                dcg = (hit_per_pos * weights).sum(1)
-                idcg = [weights[:min(n, i)].sum() for n in answer_count]
-                ndcgs = dcg / idcg
+    cutoffs = k if hasattr(k, "__iter__") else [k]
+    for i in cutoffs:
+        size = total_size if i is None else min(i, total_size)
+        dcg = predictions[:, :size] @ weights[:size]
+        ndcgs = dcg / ideal_dcg[np.minimum(answer_count, size)]
+        results["nDCG" if i is None else "nDCG@" + str(i)] = np.average(ndcgs)
+    return results
 
-                results["nDCG@" + str(i)] = np.average(ndcgs)
-        else:
-            if k is None:
-                positions = np.arange(1, total_size + 1)
-                weights = 1 / np.log2(positions + 1)
-                hit_per_pos = predictions
-                dcg = (hit_per_pos * weights).sum(1)
-                idcg = [weights[:min(n, total_size)].sum() for n in answer_count]
-                ndcgs = dcg / idcg
 
-                results["nDCG"] = np.average(ndcgs)
-            else:
-                positions = np.arange(1, k + 1)
-                weights = 1 / np.log2(positions + 1)
-                hit_per_pos = predictions[:,:k]
-                dcg = (hit_per_pos * weights).sum(1)
-                idcg = [weights[:min(n, k)].sum() for n in answer_count]
-                ndcgs = dcg / idcg
+if evaluate is not None:
+    class nDCG(evaluate.Metric):
+        def _info(self):
+            return evaluate.MetricInfo(
+                description=_DESCRIPTION,
+                citation=_CITATION,
+                inputs_description=_KWARGS_DESCRIPTION,
+                features=datasets.Features({
+                    'predictions': datasets.Sequence(datasets.Value('float')),
+                    'references': datasets.Sequence(datasets.Value('float'))
+                }),
+                reference_urls=["https://scikit-learn.org/stable/modules/generated/sklearn.metrics.ndcg_score.html"],
+            )
 
-                results["nDCG@" + str(k)] = np.average(ndcgs)
-        return results
+        def _compute(self, predictions, references=None, sample_weight=None, k=None, ignore_ties=False):
+            return ndcg(predictions, k)
@@ -0,0 +1,120 @@
+"""
+Ranking metrics with bootstrap confidence intervals and paired significance tests.
+
+All metrics are computed from the 1-based rank of the single target item of every
+sample (0 when the target was not ranked). With one relevant item per sample
+HR@k equals Recall@k and MAP equals MRR, both are reported under their usual names.
+
+Resampling is done as matrix products: a (resamples x samples) matrix of bootstrap
+counts or random signs is multiplied with the (samples x metrics) score matrix, in
+blocks so memory stays bounded for large runs.
+
+Compare two saved runs from the command line:
+
+    python -m metric.ranking outputs/<run_a>/ranks.npz outputs/<run_b>/ranks.npz
+"""
+
+import argparse
+
+import numpy as np
+
+
+def per_sample_scores(ranks, k=(10,)):
+    """Returns metric names and a (samples x metrics) matrix of per-sample scores."""
+    ranks = np.asarray(ranks, dtype=np.int64)
+    hit = ranks > 0
+    reciprocal = np.where(hit, 1 / np.maximum(ranks, 1), 0.0)
+    gain = np.where(hit, 1 / np.log2(ranks + 1), 0.0)
+
+    names, columns = [], []
+    for i in k:
+        within = hit if i is None else hit & (ranks <= i)
+        suffix = "" if i is None else f"@{i}"
+        names += [f"HR{suffix}", f"Recall{suffix}", f"nDCG{suffix}"]
+        columns += [within, within, np.where(within, gain, 0.0)]
+    names += ["MRR", "MAP"]
+    columns += [reciprocal, reciprocal]
+    return names, np.column_stack(columns).astype(np.float64)
+
+
+def _resampled_means(scores, num_resamples, rng, block=256):
+    # (resamples x samples) bootstrap counts times (samples x metrics) scores
+    n = len(scores)
+    means = []
+    for start in range(0, num_resamples, block):
+        size = min(block, num_resamples - start)
+        counts = rng.multinomial(n, np.full(n, 1 / n), size=size)
+        means.append(counts @ scores / n)
+    return np.concatenate(means)
+
+
+def bootstrap_ci(scores, num_resamples=1000, alpha=0.05, seed=0):
+    """Percentile bootstrap interval of the column means, returns (lower, upper) arrays."""
+    rng = np.random.default_rng(seed)
+    means = _resampled_means(np.asarray(scores, dtype=np.float64), num_resamples, rng)
+    return np.quantile(means, alpha / 2, axis=0), np.quantile(means, 1 - alpha / 2, axis=0)
+
+
+def summarize(ranks, k=(10,), num_resamples=1000, alpha=0.05, seed=0):
+    """Mean and bootstrap interval of every metric, {name: (mean, lower, upper)}."""
+    names, scores = per_sample_scores(ranks, k)
+    if len(scores) == 0:
+        return {name: (float("nan"),) * 3 for name in names}
+    lower, upper = bootstrap_ci(scores, num_resamples, alpha, seed)
+    means = scores.mean(0)
+    return {name: (means[i], lower[i], upper[i]) for i, name in enumerate(names)}
+
+
+def paired_test(ranks_a, ranks_b, k=(10,), num_resamples=10000, alpha=0.05, seed=0, block=256):
+    """
+    Compares two runs over the same samples. Returns {name: (difference, lower, upper, p_value)}
+    where the difference is a - b with a paired bootstrap interval, and the p-value comes from
+    a two-sided randomization test that flips the sign of every per-sample difference.
+    """
+    names, scores_a = per_sample_scores(ranks_a, k)
+    _, scores_b = per_sample_scores(ranks_b, k)
+    if scores_a.shape != scores_b.shape:
+        raise ValueError("Paired runs must cover the same samples")
+    diff = scores_a - scores_b
+    n = len(diff)
+    observed = diff.mean(0)
+
+    rng = np.random.default_rng(seed)
+    lower, upper = bootstrap_ci(diff, num_resamples, alpha, seed)
+    extreme = np.zeros(diff.shape[1])
+    for start in range(0, num_resamples, block):
+        size = min(block, num_resamples - start)
+        signs = rng.integers(0, 2, size=(size, n)) * 2.0 - 1.0
+        extreme += (np.abs(signs @ diff / n) >= np.abs(observed) - 1e-12).sum(0)
+    p_values = (extreme + 1) / (num_resamples + 1)
+    return {name: (observed[i], lower[i], upper[i], p_values[i]) for i, name in enumerate(names)}
+
+
+def align_runs(run_a, run_b, intersect=False):
+    """
+    Ranks of both runs matched by sample index, uids repeat in windowed splits. Runs must cover the
+    same samples, with `intersect` only the samples ranked in both are compared.
+    """
+    common, index_a, index_b = np.intersect1d(run_a["index"], run_b["index"], assume_unique=True, return_indices=True)
+    if not intersect and not (len(common) == len(run_a["index"]) == len(run_b["index"])):
+        raise ValueError(f"Runs rank different samples ({len(run_a['index'])} and {len(run_b['index'])}, {len(common)} shared), "
+                         "pass intersect=True (--intersect) to compare the shared ones")
+    return run_a["rank"][index_a], run_b["rank"][index_b]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Paired comparison of two runs' ranks.npz files")
+    parser.add_argument("run_a")
+    parser.add_argument("run_b")
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 5, 10])
+    parser.add_argument("--num_resamples", type=int, default=10000)
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--intersect", action="store_true", help="compare the samples ranked in both runs, e.g. with failed requests")
+    args = parser.parse_args()
+
+    ranks_a, ranks_b = align_runs(np.load(args.run_a), np.load(args.run_b), args.intersect)
+    print(f"{len(ranks_a)} paired samples")
+    results = paired_test(ranks_a, ranks_b, args.k, args.num_resamples, args.alpha, args.seed)
+    for name, (diff, lower, upper, p) in results.items():
+        print(f"{name}: {diff:+.4f} [{lower:+.4f}, {upper:+.4f}] p={p:.4f}")
@@ -0,0 +1,64 @@
+"""
+Streaming nDCG for the single-target ranking task.
+
+With exactly one relevant item the ideal DCG is 1, so a sample's nDCG@k is
+1 / log2(rank + 1) when the target is ranked within the top k and 0 otherwise.
+Instead of storing one-hot prediction vectors, the metric only keeps the sample
+count and one running gain sum per cutoff, so memory does not grow with the
+number of samples. States of parallel workers are merged by adding them up.
+
+Ranks are 1-based. A rank of 0 (or None) marks a sample where the target was not
+ranked at all, e.g. an invalid generation, and counts as a miss.
+"""
+
+import numpy as np
+
+
+class StreamingNDCG:
+    def __init__(self, k=(10,)):
+        """`k` is a cutoff or list of cutoffs, None stands for no cutoff."""
+        if k is None or isinstance(k, int):
+            k = [k]
+        self.k = list(k)
+        self.count = 0
+        self.sums = {self.name(i): 0.0 for i in self.k}
+
+    @staticmethod
+    def name(k):
+        return "nDCG" if k is None else f"nDCG@{k}"
+
+    def add(self, rank):
+        self.add_batch([rank])
+
+    def add_batch(self, ranks):
+        ranks = np.array([0 if r is None else r for r in ranks], dtype=np.int64)
+        hit = ranks > 0
+        gains = np.zeros(len(ranks))
+        gains[hit] = 1 / np.log2(ranks[hit] + 1)
+        for i in self.k:
+            within = hit if i is None else hit & (ranks <= i)
+            self.sums[self.name(i)] += float(gains[within].sum())
+        self.count += len(ranks)
+
+    def merge(self, other):
+        if other.k != self.k:
+            raise ValueError(f"Cannot merge nDCG states with cutoffs {self.k} and {other.k}")
+        self.count += other.count
+        for name, value in other.sums.items():
+            self.sums[name] += value
+        return self
+
+    def state_dict(self):
+        return {"k": self.k, "count": self.count, "sums": dict(self.sums)}
+
+    @classmethod
+    def from_state_dict(cls, state):
+        metric = cls(state["k"])
+        metric.count = state["count"]
+        metric.sums.update(state["sums"])
+        return metric
+
+    def compute(self):
+        if self.count == 0:
+            return {name: float("nan") for name in self.sums}
+        return {name: value / self.count for name, value in self.sums.items()}
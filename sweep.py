@@ -0,0 +1,79 @@
+"""
+In-process sweep over template x method x seed grids.
+
+Unlike a Hydra multirun, the item table is loaded once and every distinct
+negative sampling of the seq split is built once, then the grid is fanned out
+over a thread pool that shares them. openai runs share one pair of rate
+limiters, so the account's requests and tokens per minute hold for the whole
+sweep however many runs are in flight. Every run writes its usual outputs to its
+own directory under output_dir, and one results table is written at the end:
+
+    python sweep.py sweep.methods=[popularity,random] sweep.seeds=[1,2,3]
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import json
+import logging
+import os
+
+import hydra
+from hydra.utils import get_original_cwd
+from omegaconf import DictConfig, OmegaConf
+import pandas as pd
+
+from main import evaluate, load_items, load_split
+
+
+log = logging.getLogger(__name__)
+
+
+@hydra.main(version_base=None, config_path="config", config_name="config")
+def sweep(config: DictConfig) -> None:
+
+    output_dir = os.path.join(get_original_cwd(), config['output_dir'])
+    template_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config', 'template')
+
+    jobs = []
+    for template, method, seed in itertools.product(config['sweep']['templates'], config['sweep']['methods'], config['sweep']['seeds']):
+        job = OmegaConf.merge(config, {'template': OmegaConf.load(os.path.join(template_dir, f'{template}.yaml')),
+                                       'method': method, 'seed': seed})
+        jobs.append(((template, method, seed), job, os.path.join(output_dir, f'{template}-{method}-seed{seed}')))
+
+    items = load_items(config)
+    # one seq split per distinct sampling config, e.g. per seed when the sampling seed follows it
+    splits = {}
+    for _, job, _ in jobs:
+        key = json.dumps(OmegaConf.to_container(job['sampling'], resolve=True), sort_keys=True)
+        if key not in splits:
+            splits[key] = load_split(job)
+
+    limits = None
+    if 'openai' in config['sweep']['methods']:
+        from llm.engine import rate_limits
+        limits = rate_limits(config['engine']['requests_per_minute'], config['engine']['tokens_per_minute'])
+
+    def run(job, job_dir):
+        key = json.dumps(OmegaConf.to_container(job['sampling'], resolve=True), sort_keys=True)
+        return evaluate(job, items, splits[key], job_dir, limits=limits)
+
+    rows = []
+    with ThreadPoolExecutor(max_workers=config['sweep']['workers']) as pool:
+        futures = [(name, pool.submit(run, job, job_dir)) for name, job, job_dir in jobs]
+        for (template, method, seed), future in futures:
+            row = {'template': template, 'method': method, 'seed': seed}
+            try:
+                for metric, (mean, lower, upper) in future.result().items():
+                    row.update({metric: mean, f'{metric}_lower': lower, f'{metric}_upper': upper})
+            except Exception:
+                log.exception(f'{template}-{method}-seed{seed} failed')
+            rows.append(row)
+
+    results = pd.DataFrame(rows)
+    results.to_csv(os.path.join(output_dir, 'results.csv'), index=False)
+    means = results[[c for c in results.columns if not c.endswith(('_lower', '_upper'))]]
+    log.info(f'Sweep results ({len(rows)} runs), intervals in {os.path.join(output_dir, "results.csv")}\n'
+             + means.to_string(index=False, float_format='{:.4f}'.format))
+
+if __name__ == '__main__':
+    sweep()
@@ -0,0 +1,128 @@
+"""
+Local binary cache of the parsed item table and seq split.
+
+The first run parses MovieLens through the HF dataset scripts and stores the
+item table, the test split and, for methods that learn from them, the rating
+interactions as `.npz` arrays. Later runs with the same
+sampling config read those arrays back without importing `datasets` or running
+any dataset builder. Entries are keyed by the sampling config and the source
+of the code that produced them, so editing a dataset script invalidates them.
+
+Cached splits come back as `Columns`, which implements the part of the
+`datasets.Dataset` interface the evaluation uses (`map`, `select`, column and
+row access), so both kinds of split go through the same code.
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ITEM_SOURCES = ['datasets/ml100k.py', 'datasets/ratings.py', 'utils/vocab.py']
+SPLIT_SOURCES = ['datasets/ml100k_seq.py', 'datasets/ratings.py', 'datasets/sampler.py']
+
+
+class Columns:
+    """Column-oriented table of Python lists with a minimal `datasets.Dataset` interface."""
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.column_names = list(columns)
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.columns[key]
+        return {name: column[key] for name, column in self.columns.items()}
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def select(self, indices):
+        return Columns({name: [column[i] for i in indices] for name, column in self.columns.items()})
+
+    def map(self, function, batched=True, batch_size=1000, fn_kwargs=None, **kwargs):
+        # Only batched functions are used here, num_proc and desc are accepted for compatibility
+        batch_size = batch_size or len(self) or 1
+        out = {}
+        for start in range(0, len(self), batch_size):
+            batch = {name: column[start:start + batch_size] for name, column in self.columns.items()}
+            for name, values in function(batch, **(fn_kwargs or {})).items():
+                out.setdefault(name, []).extend(values)
+        return Columns({**{k: v for k, v in self.columns.items() if k not in out}, **out})
+
+
+def source_key(sources, **config):
+    digest = hashlib.sha256(json.dumps(config, sort_keys=True).encode())
+    for source in sources:
+        with open(os.path.join(ROOT, source), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def item_path(cache_dir):
+    return os.path.join(cache_dir, f'items-{source_key(ITEM_SOURCES)}.npz')
+
+
+def interaction_path(cache_dir):
+    return os.path.join(cache_dir, f'interactions-{source_key(ITEM_SOURCES)}.npz')
+
+
+def split_path(cache_dir, split, sampling):
+    return os.path.join(cache_dir, f'seq-{split}-{source_key(SPLIT_SOURCES, split=split, **sampling)}.npz')
+
+
+def _ragged(lists):
+    lengths = np.array([len(x) for x in lists], dtype=np.int64)
+    flat = np.concatenate([np.asarray(x, dtype=np.int64) for x in lists]) if len(lists) else np.empty(0, np.int64)
+    return flat, np.concatenate([[0], np.cumsum(lengths)])
+
+
+def save_split(path, split):
+    """Writes the uid, seq, candidates and target columns of a seq split."""
+    seq, seq_offsets = _ragged(split['seq'])
+    candidates, candidate_offsets = _ragged(split['candidates'])
+    targets = np.array([-1 if t is None else t for t in split['target']], dtype=np.int64)
+    _replace(path, lambda tmp: np.savez(tmp, uid=np.asarray(split['uid'], dtype=np.int64), seq=seq, seq_offsets=seq_offsets,
+                                        candidates=candidates, candidate_offsets=candidate_offsets, target=targets))
+
+
+def load_split(path):
+    arrays = np.load(path)
+
+    def unflatten(flat, offsets):
+        return [flat[a:b].tolist() for a, b in zip(offsets[:-1], offsets[1:])]
+
+    return Columns({
+        'uid': arrays['uid'].tolist(),
+        'seq': unflatten(arrays['seq'], arrays['seq_offsets']),
+        'candidates': unflatten(arrays['candidates'], arrays['candidate_offsets']),
+        'target': [None if t < 0 else t for t in arrays['target'].tolist()],
+    })
+
+
+def save_items(path, items):
+    _replace(path, items.save)
+
+
+def save_interactions(path, users, items, timestamps):
+    _replace(path, lambda tmp: np.savez(tmp, uid=users, item=items, timestamp=timestamps))
+
+
+def load_interactions(path):
+    arrays = np.load(path)
+    return arrays['uid'], arrays['item'], arrays['timestamp']
+
+
+def _replace(path, write):
+    # Written under a temporary name so a concurrent or interrupted run never reads half a file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp.npz'
+    write(tmp)
+    os.replace(tmp, path)
@@ -0,0 +1,74 @@
+"""
+Append-only JSONL journal of completed samples.
+
+Every completion is appended as one JSON line as soon as it arrives, and the
+file is fsynced every `sync_every` records and on exit, so a crashed or
+interrupted run loses at most the last unsynced batch. Rerunning with the same
+output_dir reads the journal back, skips the finished samples and rebuilds the
+metric state from their responses, so no completion is paid for twice.
+
+A line cut off by a crash is dropped when the journal is opened again.
+"""
+
+import atexit
+import json
+import os
+
+
+class Journal:
+    def __init__(self, path, sync_every=16):
+        self.path = path
+        self.sync_every = sync_every
+        self.records = self._read()
+        self.file = open(path, "a")
+        self.unsynced = 0
+        atexit.register(self.close)
+
+    def _read(self):
+        records = {}
+        if not os.path.exists(self.path):
+            return records
+        good = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if not line.endswith(b"\n"):
+                    break
+                records[record["index"]] = record
+                good += len(line)
+        # Anything after the last complete line was torn by a crash
+        if good < os.path.getsize(self.path):
+            with open(self.path, "r+b") as f:
+                f.truncate(good)
+        return records
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, index):
+        return index in self.records
+
+    def get(self, index):
+        return self.records.get(index)
+
+    def append(self, record):
+        self.records[record["index"]] = record
+        self.file.write(json.dumps(record) + "\n")
+        self.unsynced += 1
+        if self.unsynced >= self.sync_every:
+            self.sync()
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+
+    def close(self):
+        # the exit hook holds a reference to the journal, sweeps would keep every job's open until exit
+        atexit.unregister(self.close)
+        if not self.file.closed:
+            self.sync()
+            self.file.close()
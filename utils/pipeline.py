@@ -0,0 +1,105 @@
+"""
+Threaded pipeline stages joined by bounded queues.
+
+A pipeline is a source, which pushes items with `emit`, followed by stages that
+each take items from their input queue, transform them and hand the result to
+the next stage. Every stage runs on its own worker threads, so the slow stage
+(the requests) keeps going while the cheap ones (parsing, metric updates, log
+writes) work through what it has produced, instead of everything taking turns
+in one loop.
+
+Every queue holds at most `maxsize` items. When a stage falls behind, the
+stage feeding it blocks on the full queue and so on up to `emit`, so the source
+is slowed down instead of the backlog piling up in memory. Per item time of
+every stage is observed as `<stage>_stage_seconds` and time spent blocked on a
+full queue is counted as `<stage>_blocked_seconds` on the profiler.
+
+An exception in a stage stops the source at its next `emit`, the other stages
+drain what is queued without processing it, and `run` raises the exception.
+`on_error(exception)` is called as soon as a stage fails, so a source waiting
+on the stages' progress can wake up instead of waiting for items that never come.
+"""
+
+import queue
+import threading
+import time
+
+from utils.profiling import Profiler
+
+
+# end of stream marker, passed from stage to stage once every worker of a stage is done
+DONE = object()
+
+
+class Stage:
+    def __init__(self, name, fn, workers=1):
+        """`fn(item)` returns the item for the next stage, or None to drop it."""
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+
+
+class Pipeline:
+    def __init__(self, stages, maxsize=64, profiler=None, on_error=None):
+        self.stages = stages
+        self.on_error = on_error
+        self.queues = [queue.Queue(maxsize) for _ in stages]
+        self.profiler = profiler if profiler is not None else Profiler()
+        self.error = None
+        self.lock = threading.Lock()
+        self.running = [stage.workers for stage in stages]
+
+    def _put(self, i, item, name):
+        try:
+            self.queues[i].put_nowait(item)
+        except queue.Full:
+            start = time.perf_counter()
+            self.queues[i].put(item)
+            self.profiler.count(f"{name}_blocked_seconds", time.perf_counter() - start)
+
+    def emit(self, item):
+        if self.error is not None:
+            raise self.error
+        self._put(0, item, "source")
+
+    def _work(self, i):
+        stage = self.stages[i]
+        while True:
+            item = self.queues[i].get()
+            if item is DONE:
+                # left for the other workers of this stage
+                self.queues[i].put(DONE)
+                break
+            if self.error is not None:
+                continue
+            start = time.perf_counter()
+            try:
+                result = stage.fn(item)
+            except BaseException as e:
+                self.error = self.error or e
+                if self.on_error is not None:
+                    self.on_error(e)
+                continue
+            self.profiler.observe(f"{stage.name}_stage_seconds", time.perf_counter() - start)
+            if result is not None and i + 1 < len(self.stages):
+                self._put(i + 1, result, stage.name)
+        with self.lock:
+            self.running[i] -= 1
+            last = self.running[i] == 0
+        if last and i + 1 < len(self.stages):
+            self.queues[i + 1].put(DONE)
+
+    def run(self, source):
+        """Calls `source(emit)` and returns once every emitted item went through every stage."""
+        threads = [threading.Thread(target=self._work, args=(i,), name=f"{stage.name}-{w}", daemon=True)
+                   for i, stage in enumerate(self.stages) for w in range(stage.workers)]
+        for thread in threads:
+            thread.start()
+        try:
+            source(self.emit)
+        finally:
+            self.queues[0].put(DONE)
+            for thread in threads:
+                thread.join()
+        if self.error is not None:
+            raise self.error
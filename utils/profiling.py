@@ -0,0 +1,135 @@
+"""
+Run instrumentation: per-stage wall time, latency distributions and counters.
+
+A Profiler is filled in while a run goes on (`stage` times a block, `observe`
+records one latency, `count` adds to a counter) and is written to output_dir as
+report-<shard>-of-<n>.json and as a Prometheus textfile, metrics-<shard>-of-<n>.prom,
+which node_exporter's textfile collector can pick up. The shard suffix keeps the
+shards of one run, which share output_dir, from overwriting each other's files.
+Optionally the run's evaluation is also run under cProfile, see `profiled`.
+
+Stages, parse workers and the request engine update one Profiler from several
+threads, so every update is made under a lock.
+"""
+
+from collections import defaultdict
+from contextlib import contextmanager
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+
+import numpy as np
+
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def shard_suffix(shard_id=0, num_shards=1):
+    return f"{shard_id:05d}-of-{num_shards:05d}"
+
+
+class Profiler:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.samples = defaultdict(list)
+        self.counters = defaultdict(float)
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def observe(self, name, value):
+        with self.lock:
+            self.samples[name].append(value)
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def distributions(self):
+        summary = {}
+        with self.lock:
+            samples = {name: list(values) for name, values in self.samples.items()}
+        for name, values in samples.items():
+            values = np.asarray(values, dtype=np.float64)
+            quantiles = np.quantile(values, QUANTILES)
+            summary[name] = {"count": len(values), "sum": float(values.sum()), "mean": float(values.mean()),
+                             "max": float(values.max()), **{f"p{round(q * 100)}": float(v) for q, v in zip(QUANTILES, quantiles)}}
+        return summary
+
+    def report(self):
+        wall = time.perf_counter() - self.started
+        with self.lock:
+            counters = dict(self.counters)
+            stages = dict(self.stages)
+        throughput = {}
+        if counters.get("samples"):
+            throughput["samples_per_second"] = counters["samples"] / wall
+            if stages.get("dispatch"):
+                throughput["dispatch_samples_per_second"] = counters["samples"] / stages["dispatch"]
+        return {"wall_seconds": wall, "stages": stages, "latency": self.distributions(),
+                "counters": counters, "throughput": throughput}
+
+    def write_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+
+    def write_prometheus(self, path, labels=None, prefix="lmrec"):
+        report = self.report()
+        base = ",".join(f'{k}="{v}"' for k, v in (labels or {}).items())
+
+        def series(name, value, **extra):
+            label = ",".join(filter(None, [base] + [f'{k}="{v}"' for k, v in extra.items()]))
+            return f"{prefix}_{name}{{{label}}} {value}" if label else f"{prefix}_{name} {value}"
+
+        lines = [f"# TYPE {prefix}_wall_seconds gauge", series("wall_seconds", report["wall_seconds"]),
+                 f"# TYPE {prefix}_stage_seconds gauge"]
+        lines += [series("stage_seconds", v, stage=k) for k, v in report["stages"].items()]
+        for name, dist in report["latency"].items():
+            lines.append(f"# TYPE {prefix}_{name} summary")
+            lines += [series(name, dist[f"p{round(q * 100)}"], quantile=q) for q in QUANTILES]
+            lines += [series(f"{name}_sum", dist["sum"]), series(f"{name}_count", dist["count"])]
+        for name, value in report["counters"].items():
+            lines += [f"# TYPE {prefix}_{name}_total counter", series(f"{name}_total", value)]
+        for name, value in report["throughput"].items():
+            lines += [f"# TYPE {prefix}_{name} gauge", series(name, value)]
+        # Written under a temporary name, the textfile collector must never read a partial file
+        with open(path + ".tmp", "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(path + ".tmp", path)
+
+    def write(self, output_dir, labels=None, shard_id=0, num_shards=1):
+        suffix = shard_suffix(shard_id, num_shards)
+        self.write_json(os.path.join(output_dir, f"report-{suffix}.json"))
+        self.write_prometheus(os.path.join(output_dir, f"metrics-{suffix}.prom"), labels)
+
+
+@contextmanager
+def profiled(output_dir, enabled=True, top=40, shard_id=0, num_shards=1):
+    """Runs the block under cProfile and writes profile-<shard>-of-<n>.pstats and the top functions to profile-<shard>-of-<n>.txt."""
+    if not enabled:
+        yield
+        return
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        suffix = shard_suffix(shard_id, num_shards)
+        profile.dump_stats(os.path.join(output_dir, f"profile-{suffix}.pstats"))
+        text = io.StringIO()
+        pstats.Stats(profile, stream=text).sort_stats("cumulative").print_stats(top)
+        with open(os.path.join(output_dir, f"profile-{suffix}.txt"), "w") as f:
+            f.write(text.getvalue())
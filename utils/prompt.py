@@ -0,0 +1,69 @@
+"""
+Prompt rendering for the ranking templates.
+
+Templates use [SEQ], [CANDIDATES] and [NUM_CANDIDATES] placeholders. They are
+compiled once into a `str.format_map` pattern instead of chained `str.replace`
+calls per sample. Candidates are shuffled with a permutation derived from
+(seed, uid), or (seed, uid, position) for the windows of a windowed split which
+share their uid, so every example gets the same order no matter which process or
+batch renders it, and `Dataset.map` can safely cache the result by fingerprint.
+"""
+
+import re
+
+import numpy as np
+
+
+PLACEHOLDER = re.compile(r"\[([A-Z_]+)\]")
+
+
+class PromptTemplate:
+    def __init__(self, text):
+        escaped = text.replace("{", "{{").replace("}", "}}")
+        self.pattern = PLACEHOLDER.sub(lambda m: "{" + m.group(1) + "}", escaped)
+        self.fields = sorted(set(PLACEHOLDER.findall(text)))
+
+    def render(self, **values):
+        return self.pattern.format_map(values)
+
+
+def candidate_permutation(seed, uid, size, position=None):
+    key = [seed, uid] if position is None else [seed, uid, position]
+    return np.random.default_rng(key).permutation(size)
+
+
+def _encode_ragged(vocab, lists):
+    # One vocabulary lookup for the whole batch, then split back per example
+    lengths = [len(x) for x in lists]
+    if sum(lengths) == 0:
+        return [np.empty(0, dtype=np.int32) for _ in lists]
+    flat = vocab.encode(np.concatenate([np.asarray(x, dtype=np.int64) for x in lists]))
+    return np.split(flat, np.cumsum(lengths)[:-1])
+
+
+def render_batch(examples, vocab, titles, prompt, seed):
+    """Batched `Dataset.map` function turning MovieLens ids into item codes, titles and prompts."""
+    template = PromptTemplate(prompt)
+    seqs = _encode_ragged(vocab, examples['seq'])
+    candidates = _encode_ragged(vocab, examples['candidates'])
+    targets = vocab.encode(examples['target'])
+
+    # only windowed splits have a position, one sample per user is keyed by uid alone
+    positions = examples['position'] if 'position' in examples else [None] * len(targets)
+
+    columns = {k: [] for k in ['seq', 'candidates', 'target', 'candidates_and_answer', 'can_input', 'input', 'answer', 'prompt']}
+    for uid, position, seq, cands, target in zip(examples['uid'], positions, seqs, candidates, targets):
+        candidates_and_answer = np.append(cands, target)
+        candidates_and_answer = candidates_and_answer[candidate_permutation(seed, uid, len(candidates_and_answer), position)]
+        can_input = '\n'.join([f'{i+1}. {title}' for i, title in enumerate(titles[candidates_and_answer])])
+        seq_input = '\n'.join(titles[seq])
+
+        columns['seq'].append(seq.tolist())
+        columns['candidates'].append(cands.tolist())
+        columns['target'].append(int(target))
+        columns['candidates_and_answer'].append(candidates_and_answer.tolist())
+        columns['can_input'].append(can_input)
+        columns['input'].append(seq_input)
+        columns['answer'].append(titles[target])
+        columns['prompt'].append(template.render(SEQ=seq_input, CANDIDATES=can_input, NUM_CANDIDATES=len(candidates_and_answer)))
+    return columns
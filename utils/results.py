@@ -0,0 +1,177 @@
+"""
+Structured per-sample result records, written by a background thread.
+
+Every sample of a run becomes one record (index, uid, prompt hash, response,
+parsed ranking, target rank, latency, error class) in a gzip compressed JSONL
+file or a Parquet file, next to the run's other outputs. `write` only puts the
+record on a queue. A writer thread collects records and writes them in batches
+of `flush_every`, or whatever is queued once the queue stays empty for
+`flush_seconds`, so the evaluation never waits on disk.
+
+Prompts are most of a run's bytes, so with `dedupe_prompts` each distinct
+prompt is written once to a prompts file keyed by its hash and the records
+carry only the hash, which keeps the records file small enough to load in a
+moment. Without it the full prompt is stored in every record. `load_results`
+reads the records of every shard back into one DataFrame, with the prompts
+joined back in when asked for:
+
+    from utils.results import load_results
+    frame = load_results('outputs/2023-06-01/12-00-00', prompts=True)
+"""
+
+import glob
+import gzip
+import hashlib
+import json
+import os
+import queue
+import threading
+
+
+FORMATS = {'jsonl': '.jsonl.gz', 'parquet': '.parquet'}
+COLUMNS = ['index', 'uid', 'prompt_hash', 'prompt', 'response', 'ranking', 'rank', 'latency', 'error']
+DONE = object()
+
+
+def prompt_hash(prompt):
+    return hashlib.sha256(prompt.encode()).hexdigest()[:16]
+
+
+def result_paths(output_dir, shard_id, num_shards, format='jsonl'):
+    """(records path, prompts path) of one shard, shards of a run share output_dir."""
+    suffix = f'{shard_id:05d}-of-{num_shards:05d}{FORMATS[format]}'
+    return os.path.join(output_dir, f'results-{suffix}'), os.path.join(output_dir, f'prompts-{suffix}')
+
+
+class _JsonlFile:
+    def __init__(self, path):
+        self.file = gzip.open(path, 'wt', compresslevel=6, encoding='utf-8')
+
+    def write(self, rows):
+        self.file.write(''.join(json.dumps(row) + '\n' for row in rows))
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class _ParquetFile:
+    def __init__(self, path, columns):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        types = {'index': pa.int64(), 'uid': pa.int64(), 'prompt_hash': pa.string(), 'prompt': pa.string(),
+                 'response': pa.string(), 'ranking': pa.list_(pa.int32()), 'rank': pa.int64(),
+                 'latency': pa.float64(), 'error': pa.string()}
+        self.pa = pa
+        self.schema = pa.schema([(name, types[name]) for name in columns])
+        # one row group per flushed batch
+        self.writer = pq.ParquetWriter(path, self.schema, compression='zstd')
+
+    def write(self, rows):
+        self.writer.write_table(self.pa.Table.from_pylist(rows, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+class ResultWriter:
+    def __init__(self, output_dir, shard_id=0, num_shards=1, format='jsonl', dedupe_prompts=True,
+                 flush_every=256, flush_seconds=1.0, queue_size=4096):
+        if format not in FORMATS:
+            raise ValueError(f'Unknown result format {format!r}, expected one of {list(FORMATS)}')
+        self.path, self.prompt_path = result_paths(output_dir, shard_id, num_shards, format)
+        self.format = format
+        self.dedupe_prompts = dedupe_prompts
+        self.flush_every = flush_every
+        self.flush_seconds = flush_seconds
+        self.columns = [c for c in COLUMNS if c != ('prompt' if dedupe_prompts else 'prompt_hash')]
+        self.queue = queue.Queue(queue_size)
+        self.count = 0
+        self.error = None
+        self.seen = set()
+        self.thread = threading.Thread(target=self._run, name='result-writer', daemon=True)
+        self.thread.start()
+
+    def _open(self, path, columns):
+        return _JsonlFile(path) if self.format == 'jsonl' else _ParquetFile(path, columns)
+
+    def write(self, index, uid, prompt, response=None, ranking=None, rank=None, latency=None, error=None):
+        """Queues one sample's record, `error` is an exception or an error class name."""
+        if self.error is not None:
+            raise self.error
+        if isinstance(error, BaseException):
+            error = type(error).__name__
+        self.queue.put({'index': int(index), 'uid': int(uid), 'prompt': prompt, 'response': response, 'ranking': ranking,
+                        'rank': None if rank is None else int(rank), 'latency': latency, 'error': error})
+
+    def _run(self):
+        records = prompts = None
+        batch = []
+        done = False
+        try:
+            records = self._open(self.path, self.columns)
+            prompts = self._open(self.prompt_path, ['prompt_hash', 'prompt']) if self.dedupe_prompts else None
+            while not done:
+                try:
+                    record = self.queue.get(timeout=self.flush_seconds)
+                except queue.Empty:
+                    record = None
+                done = record is DONE
+                if record is not None and not done:
+                    batch.append(record)
+                if batch and (record is None or done or len(batch) >= self.flush_every):
+                    self._flush(batch, records, prompts)
+                    batch = []
+        except BaseException as e:
+            self.error = e
+            # keep taking records so writers never block on a full queue
+            while not done:
+                done = self.queue.get() is DONE
+        finally:
+            for f in (records, prompts):
+                if f is not None:
+                    f.close()
+
+    def _flush(self, batch, records, prompts):
+        if self.dedupe_prompts:
+            new = []
+            for record in batch:
+                prompt = record.pop('prompt')
+                record['prompt_hash'] = prompt_hash(prompt)
+                if record['prompt_hash'] not in self.seen:
+                    self.seen.add(record['prompt_hash'])
+                    new.append({'prompt_hash': record['prompt_hash'], 'prompt': prompt})
+            if new:
+                prompts.write(new)
+        records.write([{c: record[c] for c in self.columns} for record in batch])
+        self.count += len(batch)
+
+    def close(self):
+        """Writes what is still queued and closes the files."""
+        if self.thread.is_alive():
+            self.queue.put(DONE)
+            self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+
+def _read(path):
+    import pandas as pd
+    if path.endswith(FORMATS['parquet']):
+        return pd.read_parquet(path)
+    return pd.read_json(path, lines=True, compression='gzip', dtype=False)
+
+
+def load_results(output_dir, prompts=False):
+    """Records of every shard in output_dir as one DataFrame sorted by index, `prompts` joins the prompt texts back."""
+    # pandas is only needed to read results back, runs that write them never import it
+    import pandas as pd
+    paths = sorted(p for suffix in FORMATS.values() for p in glob.glob(os.path.join(output_dir, f'results-*{suffix}')))
+    if not paths:
+        raise FileNotFoundError(f'No result files in {output_dir}')
+    frame = pd.concat([_read(path) for path in paths], ignore_index=True).sort_values('index', ignore_index=True)
+    if prompts and 'prompt_hash' in frame:
+        prompt_paths = [p.replace(os.sep + 'results-', os.sep + 'prompts-') for p in paths]
+        texts = pd.concat([_read(path) for path in prompt_paths if os.path.exists(path)], ignore_index=True)
+        frame = frame.merge(texts.drop_duplicates('prompt_hash'), on='prompt_hash', how='left')
+    return frame
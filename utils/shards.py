@@ -0,0 +1,103 @@
+"""
+Sharded evaluation.
+
+Test samples are split by position, shard `i` of `n` takes every n-th sample
+starting at `i`, so the split only depends on the sample order and every shard
+gets users from the whole range. Each shard writes its per-sample ranks, raw
+outputs, error cases and partial nDCG state to its own file, and the shards of
+one run are merged into the final report:
+
+    python main.py output_dir=outputs/run shard_id=0 num_shards=4   # on each machine
+    python -m utils.shards outputs/run
+"""
+
+import argparse
+import glob
+import json
+import os
+
+import numpy as np
+
+from metric.ranking import summarize
+from metric.stream import StreamingNDCG
+
+
+def shard_indices(num_samples, shard_id=0, num_shards=1):
+    if not 0 <= shard_id < num_shards:
+        raise ValueError(f"shard_id must be in [0, {num_shards}), got {shard_id}")
+    return np.arange(shard_id, num_samples, num_shards)
+
+
+def shard_path(output_dir, shard_id, num_shards):
+    return os.path.join(output_dir, f"shard-{shard_id:05d}-of-{num_shards:05d}.json")
+
+
+def write_shard(path, shard_id, num_shards, index, uid, rank, ndcg, outputs, errors, metric):
+    """`outputs` and `errors` map a sample index to the raw response and the error message."""
+    shard = {
+        "shard_id": shard_id,
+        "num_shards": num_shards,
+        "index": np.asarray(index).tolist(),
+        "uid": np.asarray(uid).tolist(),
+        "rank": np.asarray(rank).tolist(),
+        "ndcg": ndcg.state_dict(),
+        "outputs": {str(k): v for k, v in outputs.items()},
+        "errors": {str(k): v for k, v in errors.items()},
+        "metric": metric,
+    }
+    # Written under a temporary name so a crashed shard never leaves a partial file behind
+    with open(path + ".tmp", "w") as f:
+        json.dump(shard, f)
+    os.replace(path + ".tmp", path)
+
+
+def load_shards(output_dir):
+    shards = [json.load(open(fname)) for fname in sorted(glob.glob(os.path.join(output_dir, "shard-*-of-*.json")))]
+    if not shards:
+        raise FileNotFoundError(f"No shard files in {output_dir}")
+    num_shards = shards[0]["num_shards"]
+    found = sorted(s["shard_id"] for s in shards)
+    if any(s["num_shards"] != num_shards for s in shards) or found != list(range(num_shards)):
+        raise ValueError(f"Expected shards 0..{num_shards - 1} of {num_shards}, found {found}")
+    return shards
+
+
+def merge_shards(shards):
+    """Combines shard results into (index, uid, rank, ndcg, outputs, errors) ordered by sample index."""
+    index = np.concatenate([np.asarray(s["index"], dtype=np.int64) for s in shards])
+    order = np.argsort(index, kind="stable")
+    uid = np.concatenate([np.asarray(s["uid"], dtype=np.int64) for s in shards])[order]
+    rank = np.concatenate([np.asarray(s["rank"], dtype=np.int64) for s in shards])[order]
+
+    ndcg = StreamingNDCG.from_state_dict(shards[0]["ndcg"])
+    for s in shards[1:]:
+        ndcg.merge(StreamingNDCG.from_state_dict(s["ndcg"]))
+
+    outputs, errors = {}, {}
+    for s in shards:
+        outputs.update({int(k): v for k, v in s["outputs"].items()})
+        errors.update({int(k): v for k, v in s["errors"].items()})
+    return index[order], uid, rank, ndcg, dict(sorted(outputs.items())), dict(sorted(errors.items()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge the shard files of one run into its final report")
+    parser.add_argument("output_dir")
+    args = parser.parse_args()
+
+    shards = load_shards(args.output_dir)
+    index, uid, rank, ndcg, outputs, errors = merge_shards(shards)
+    np.savez(os.path.join(args.output_dir, "ranks.npz"), index=index, uid=uid, rank=rank)
+
+    metric = shards[0]["metric"]
+    print(f"Merged {len(shards)} shards, {len(rank)} ranked samples, {len(errors)} errors")
+    for k, v in ndcg.compute().items():
+        print(f"{k}: {v}")
+    summary = summarize(rank, metric["k"], metric["num_resamples"], metric["alpha"], metric["seed"])
+    print(f'Ranking metrics with {1 - metric["alpha"]:.0%} bootstrap intervals over {len(rank)} samples')
+    for k, (mean, lower, upper) in summary.items():
+        print(f"{k}: {mean:.4f} [{lower:.4f}, {upper:.4f}]")
+    if errors:
+        print("Error cases")
+        for k, v in errors.items():
+            print(f"{k}: {v}")
@@ -0,0 +1,75 @@
+"""
+Dense integer ids for users and items.
+
+Ids are mapped to contiguous int32 codes once, and everything keyed by item
+(titles, genre flags, popularity) lives in NumPy arrays indexed by those codes,
+so per-sample work is array indexing instead of dict lookups.
+"""
+
+import numpy as np
+
+
+class Vocab:
+    def __init__(self, ids):
+        # Sorted copy of the ids for binary search, codes follow the given order
+        self.ids = np.asarray(ids)
+        self.order = np.argsort(self.ids, kind='stable')
+        self.sorted = self.ids[self.order]
+        if (self.sorted[1:] == self.sorted[:-1]).any():
+            raise ValueError("Vocabulary ids must be unique")
+
+    def __len__(self):
+        return len(self.ids)
+
+    def encode(self, ids):
+        ids = np.asarray(ids)
+        position = np.minimum(np.searchsorted(self.sorted, ids), max(len(self.ids) - 1, 0))
+        known = self.sorted[position] == ids if len(self.ids) else np.zeros(ids.shape, dtype=bool)
+        if not np.all(known):
+            raise KeyError(f"Unknown ids {ids[~known][:5].tolist()}")
+        return self.order[position].astype(np.int32)
+
+    def decode(self, codes):
+        return self.ids[np.asarray(codes)]
+
+
+def int_column(dataset, name):
+    """Reads a string or integer id column of a HF dataset as an int64 array without Python objects."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    column = dataset.data.column(name)
+    if not pa.types.is_integer(column.type):
+        column = pc.cast(column, pa.int64())
+    return column.to_numpy()
+
+
+class ItemTable:
+    """Titles, genre flags and popularity of every item, indexed by dense item code."""
+
+    def __init__(self, item, data):
+        self.vocab = Vocab(int_column(item, 'iid'))
+        self.titles = np.asarray(item['title'], dtype=object)
+        self.genre_names = [k for k, v in item.features.items() if getattr(v, 'dtype', None) == 'bool']
+        self.genres = np.column_stack([np.asarray(item[g], dtype=bool) for g in self.genre_names])
+        # Number of ratings per item in one pass
+        self.popularity = np.bincount(self.vocab.encode(int_column(data, 'iid')), minlength=len(self.vocab))
+
+    def __len__(self):
+        return len(self.vocab)
+
+    def save(self, path):
+        np.savez(path, iid=self.vocab.ids, titles=self.titles.astype(str), genre_names=np.asarray(self.genre_names),
+                 genres=self.genres, popularity=self.popularity)
+
+    @classmethod
+    def load(cls, path):
+        """Reads a table written by `save` without the HF datasets it was built from."""
+        arrays = np.load(path)
+        table = cls.__new__(cls)
+        table.vocab = Vocab(arrays['iid'])
+        table.titles = arrays['titles'].astype(object)
+        table.genre_names = arrays['genre_names'].tolist()
+        table.genres = arrays['genres']
+        table.popularity = arrays['popularity']
+        return table